@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：文字提取的時間與記憶體
+比較 page.get_text("dict") 預設旗標（含圖片資料）與 text_extract_flags()（只含文字）
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from bench_pipeline import make_pdf
+from pdf_translator import text_extract_flags
+
+
+def run(pdf_path, flags):
+    """提取全部頁面，返回 (秒數, Python 配置峰值位元組, 文字區塊數)"""
+    doc = fitz.open(pdf_path)
+    tracemalloc.start()
+    started = time.perf_counter()
+    blocks = 0
+    for page in doc:
+        if flags is None:
+            data = page.get_text("dict")
+        else:
+            data = page.get_text("dict", flags=flags)
+        blocks += sum(1 for block in data["blocks"] if block["type"] == 0)
+        del data
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    doc.close()
+    return elapsed, peak, blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Text extraction cost: default "dict" flags vs text-only flags')
+    parser.add_argument('pdf', nargs='?', help='PDF to measure (default: generate a synthetic image-heavy PDF)')
+    parser.add_argument('--pages', type=int, default=20, help='Pages of the synthetic PDF (default: 20)')
+    args = parser.parse_args()
+    
+    pdf_path = args.pdf
+    tmp_dir = None
+    if not pdf_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        pdf_path = os.path.join(tmp_dir.name, 'images.pdf')
+        # 每頁一張大圖與數十行文字，模擬掃描加文字的型錄
+        make_pdf(pdf_path, args.pages, 30, 1, 1, image_size=800)
+    
+    default_time, default_peak, default_blocks = run(pdf_path, None)
+    text_time, text_peak, text_blocks = run(pdf_path, text_extract_flags())
+    
+    print(f"PDF: {pdf_path}")
+    print(f"default flags: {default_time:7.3f}s, peak {default_peak / 1024 / 1024:8.2f} MB, {default_blocks} text blocks")
+    print(f"text only:     {text_time:7.3f}s, peak {text_peak / 1024 / 1024:8.2f} MB, {text_blocks} text blocks")
+    print(f"Saved:         {default_time - text_time:7.3f}s, {(default_peak - text_peak) / 1024 / 1024:8.2f} MB")
+    
+    if tmp_dir:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
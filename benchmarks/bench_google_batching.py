@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：Google 引擎的合併請求
+啟動本機的 translate_a/single 替身伺服器（可設定延遲、失敗率與漏掉換行的比例），
+讓 googletrans 改連替身，以合成 PDF 比較逐段翻譯（--batch-chars 0）與合併請求的請求數、耗時與翻譯完成數；
+替身與實際服務一樣拒絕過長的 URL（414），--script cjk 可檢查 URL 編碼後大幅膨脹的中文原文
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import PRESETS, make_pdf
+from pdf_translator import MockEngine, PDFTranslatorCLI
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模仿 translate.googleapis.com/translate_a/single 的回應格式，每行譯文為一個句段"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        text = query.get('q', [''])[0]
+        dest = query.get('tl', ['zh-tw'])[0]
+        with server.lock:
+            server.requests += 1
+            server.longest_url = max(server.longest_url, len(self.path))
+            fail = server.rng.random() < server.fail_rate
+            merge = server.rng.random() < server.merge_rate
+        if server.latency:
+            time.sleep(server.latency)
+        if len(self.path) > server.max_url:
+            self._send(414, b'URI Too Long')
+            return
+        if fail:
+            self._send(500, b'error')
+            return
+
+        lines = text.split('\n')
+        translated = [server.engine.fake_translation(line, dest) for line in lines]
+        segments = [[line + '\n', source + '\n', None, None, 3] for line, source in zip(translated, lines)]
+        segments[-1] = [translated[-1], lines[-1], None, None, 3]
+        if merge and len(segments) > 1:
+            # 模擬服務把兩行合併成一句
+            segments[0][0] = segments[0][0].rstrip('\n') + ' '
+        self._send(200, json.dumps([segments, None, 'en']).encode('utf-8'))
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stand_in(latency, fail_rate, merge_rate, max_url=8192, seed=0):
+    """在背景執行緒啟動替身伺服器，並讓 googletrans 改用它；返回伺服器"""
+    import googletrans.urls
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.rng = random.Random(seed)
+    server.requests = 0
+    server.longest_url = 0
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.merge_rate = merge_rate
+    server.max_url = max_url
+    server.engine = MockEngine()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    googletrans.urls.TRANSLATE = f'http://127.0.0.1:{server.server_address[1]}/translate_a/single'
+    return server
+
+
+def run(input_pdf, batch_chars, workers, server):
+    """以指定的字元預算翻譯 input_pdf，返回結果摘要"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        translator = PDFTranslatorCLI(
+            input_pdf, os.path.join(tmp_dir, 'output.pdf'), target_lang='zh-TW', engine='google', workers=workers,
+            use_cache=False, rate=1e6, max_rate=1e6, batch_chars=batch_chars
+        )
+        served_before = server.requests
+        server.longest_url = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            ok = translator.process()
+            seconds = time.perf_counter() - started
+    counters = translator.result['metrics']['counters'] if ok else {}
+    return {
+        'batch_chars': batch_chars,
+        'ok': ok,
+        'error': translator.result['error'],
+        'segments': translator.result['segments'],
+        'translated': translator.result['translated'],
+        'requests': counters.get('requests', 0),
+        'served': server.requests - served_before,
+        'errors': counters.get('request_errors', 0),
+        'splits': counters.get('batch_splits', 0),
+        'longest_url': server.longest_url,
+        'seconds': round(seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Google engine request packing against a local stand-in server')
+    parser.add_argument('--preset', default='medium', choices=list(PRESETS),
+                        help='Synthetic document size (default: medium)')
+    parser.add_argument('--batch-chars', default='0,1000,5000',
+                        help='Comma-separated character budgets to compare; 0 is one span per request '
+                             '(default: 0,1000,5000)')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Stand-in latency per request (default: 20)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--merge-rate', type=float, default=0.0,
+                        help='Fraction of responses that merge two lines, forcing a split and retry')
+    parser.add_argument('--workers', type=int, default=1, help='Concurrent translation requests (default: 1)')
+    parser.add_argument('--script', default='latin', choices=['latin', 'cjk'],
+                        help='Source text script; cjk text grows ninefold when URL-encoded (default: latin)')
+    parser.add_argument('--max-url', type=int, default=8192,
+                        help='Longest request URL the stand-in accepts before answering 414 (default: 8192)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    server = start_stand_in(args.latency_ms / 1000, args.fail_rate, args.merge_rate, args.max_url)
+    pages, spans, images, fonts = PRESETS[args.preset]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_pdf = os.path.join(tmp_dir, 'input.pdf')
+        make_pdf(input_pdf, pages, spans, 0, fonts, script=args.script)
+
+        print(f"{args.preset} ({args.script}): {pages} pages x {spans} spans, stand-in latency {args.latency_ms:g} ms, "
+              f"fail rate {args.fail_rate:g}, merge rate {args.merge_rate:g}, {args.workers} worker(s)")
+        print(f"{'batch chars':>11} {'segments':>8} {'translated':>10} {'requests':>8} {'errors':>6} {'splits':>6} "
+              f"{'longest URL':>11} {'seconds':>8} {'reduction':>9}")
+        results = []
+        for budget in args.batch_chars.split(','):
+            result = run(input_pdf, int(budget), args.workers, server)
+            results.append(result)
+            if not result['ok']:
+                print(f"{budget:>11} FAILED: {result['error']}")
+                continue
+            baseline = results[0]['requests'] if results[0]['ok'] else 0
+            reduction = f"{baseline / result['requests']:.1f}x" if baseline and result['requests'] else '-'
+            print(f"{result['batch_chars']:>11} {result['segments']:>8} {result['translated']:>10} "
+                  f"{result['requests']:>8} {result['errors']:>6} {result['splits']:>6} {result['longest_url']:>11} "
+                  f"{result['seconds']:>7.2f}s "
+                  f"{reduction:>9}")
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'preset': args.preset, 'script': args.script, 'max_url': args.max_url, 'latency_ms': args.latency_ms, 'fail_rate': args.fail_rate,
+                       'merge_rate': args.merge_rate, 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
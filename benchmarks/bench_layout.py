@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：譯文排版（字級與換行）的單段成本
+比較 TextLayout.fit 的一次計算，與以 TextWriter.fill_textbox 反覆縮小字級試放的做法
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from pdf_translator import FONT_CANDIDATES, TextLayout, load_font
+
+CJK_SAMPLE = '這是翻譯後的中文內容包含產品說明與技術規格請參考下列表格資料數值單位'
+LATIN_SAMPLE = ['model', 'v2.1', 'API', 'PDF', 'GHz', 'USB-C', 'ISO-9001', '(x86_64)']
+
+
+def make_spans(count, seed=0):
+    """產生隨機譯文與原文範圍：多數為單行短句，約一成為多行區塊"""
+    rng = random.Random(seed)
+    spans = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(1, 6)):
+            if rng.random() < 0.7:
+                start = rng.randrange(len(CJK_SAMPLE) - 8)
+                parts.append(CJK_SAMPLE[start:start + rng.randint(2, 8)])
+            else:
+                parts.append(' ' + rng.choice(LATIN_SAMPLE) + ' ')
+        text = ''.join(parts).strip()
+        size = rng.choice([8, 9, 10, 11, 12, 14])
+        if rng.random() < 0.1:
+            lines = rng.randint(2, 6)
+            spans.append((text * lines, rng.uniform(150, 400), size * 1.2 * lines, size))
+        else:
+            spans.append((text, rng.uniform(30, 250), size * 1.2, size))
+    return spans
+
+
+def fit_by_trial(writer, font, text, width, height, size):
+    """舊做法：以 fill_textbox 試放，放不下就縮小字級再試"""
+    rect = fitz.Rect(0, 0, width, height)
+    for _ in range(3):
+        try:
+            writer.fill_textbox(rect, text, font=font, fontsize=size, warn=False)
+            return size
+        except ValueError:
+            size *= 0.8
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-span layout cost: cached glyph widths vs fill_textbox trials')
+    parser.add_argument('--spans', type=int, default=100000, help='Spans to lay out (default: 100000)')
+    parser.add_argument('--trial-spans', type=int, default=2000,
+                        help='Spans for the fill_textbox comparison (default: 2000)')
+    args = parser.parse_args()
+    
+    spans = make_spans(args.spans)
+    font = load_font(FONT_CANDIDATES[0])
+    
+    layout = TextLayout(font)
+    started = time.perf_counter()
+    for text, width, height, size in spans:
+        layout.fit(text, width, height, size)
+    cold_time = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    wrapped = 0
+    for text, width, height, size in spans:
+        wrapped += len(layout.fit(text, width, height, size)[1]) > 1
+    warm_time = time.perf_counter() - started
+    
+    trial_spans = spans[:args.trial_spans]
+    started = time.perf_counter()
+    for text, width, height, size in trial_spans:
+        fit_by_trial(fitz.TextWriter(fitz.Rect(0, 0, 600, 800)), font, text, width, height, size)
+    trial_time = time.perf_counter() - started
+    
+    per_span = warm_time / len(spans) * 1e6
+    per_trial = trial_time / len(trial_spans) * 1e6
+    print(f"TextLayout.fit:  {len(spans)} spans, first pass {cold_time:6.2f}s, cached {warm_time:6.2f}s "
+          f"({per_span:6.1f} us/span, {wrapped} wrapped, {len(layout.widths)} glyph widths cached)")
+    print(f"fill_textbox:    {len(trial_spans)} spans, {trial_time:6.2f}s ({per_trial:6.1f} us/span)")
+    print(f"Speedup:         {per_trial / max(per_span, 1e-9):6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：Ollama 用戶端的每請求成本
+啟動本機的 Ollama 替身伺服器（/api/tags、串流 /api/generate，可設定延遲與每個 token 的間隔），比較三種送出方式：
+bare（每次 requests.post，不重用連線，即改用連線池之前的做法）、session（共用連線池）與 async（單一事件迴圈），
+輸出每秒請求數、扣除伺服器延遲後的每請求用戶端成本、伺服器端實際建立的連線數與首個 token 時間；
+另以一個不會結束的生成量測取消請求與失控輸出截斷所需的時間
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pdf_translator import AsyncTranslationPool, OllamaEngine, RateLimiter, TranslationCancelled, TranslationPool
+
+MODES = ('bare', 'session', 'async')
+MODEL = 'bench-model'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模仿 Ollama 的 /api/tags 與 /api/generate；串流時每個 token 一行 JSON，提示詞含 RUNAWAY 時持續輸出直到
+    num_predict 上限或用戶端斷線"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.connections.get_lock():
+            self.server.connections.value += 1
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send(200, {'models': [{'name': MODEL}]})
+        else:
+            self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        with self.server.requests.get_lock():
+            self.server.requests.value += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not request.get('stream', True):
+            self._send(200, {'model': MODEL, 'response': fake_response(request['prompt']), 'done': True})
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        limit = request.get('options', {}).get('num_predict') or 100000
+        if 'RUNAWAY' in request['prompt']:
+            tokens = ('重複' for _ in range(limit))
+        else:
+            response = fake_response(request['prompt'])
+            tokens = (response[i:i + 2] for i in range(0, len(response), 2))
+        count = 0
+        started = time.perf_counter()
+        try:
+            for token in tokens:
+                if self.server.token_delay:
+                    time.sleep(self.server.token_delay)
+                self._chunk({'model': MODEL, 'response': token, 'done': False})
+                count += 1
+            self._chunk({'model': MODEL, 'response': '', 'done': True,
+                         'done_reason': 'length' if count >= limit else 'stop', 'eval_count': count,
+                         'eval_duration': int((time.perf_counter() - started) * 1e9)})
+            self.wfile.write(b'0\r\n\r\n')
+        except OSError:
+            # 用戶端中止串流
+            self.close_connection = True
+
+    def _chunk(self, payload):
+        data = json.dumps(payload).encode('utf-8') + b'\n'
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def fake_response(prompt):
+    """依提示詞產生假譯文：批次提示詞逐行保留編號，單段提示詞直接加上標記"""
+    if 'Lines to translate:\n' in prompt:
+        lines = prompt.split('Lines to translate:\n', 1)[1].split('\n\nTranslations:', 1)[0].splitlines()
+        return '\n'.join(re.sub(r'^\[(\d+)\] ', r'[\1] 譯', line) for line in lines)
+    return '譯' + prompt.split('Text to translate:\n', 1)[1].split('\n\nTranslation:', 1)[0]
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # 不重用連線時每個請求都是新連線，預設的 5 會讓連線被拒
+
+
+def serve(latency, token_delay, requests, connections, ports):
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    server.latency = latency
+    server.token_delay = token_delay
+    server.requests = requests
+    server.connections = connections
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StandIn:
+    """在獨立行程中執行的替身伺服器，伺服器端的 CPU 成本才不會算進用戶端"""
+
+    def __init__(self, latency, token_delay=0.0):
+        context = multiprocessing.get_context('spawn')
+        self.latency = latency
+        self._requests = context.Value('i', 0)
+        self._connections = context.Value('i', 0)
+        ports = context.Queue()
+        self.process = context.Process(target=serve, args=(latency, token_delay, self._requests, self._connections, ports),
+                                       daemon=True)
+        self.process.start()
+        self.url = f'http://127.0.0.1:{ports.get()}'
+
+    @property
+    def requests(self):
+        return self._requests.value
+
+    @property
+    def connections(self):
+        return self._connections.value
+
+    def reset(self):
+        self._requests.value = 0
+        self._connections.value = 0
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+
+def run(mode, server, requests_count, workers):
+    """以指定方式送出 requests_count 個單段翻譯請求，返回結果摘要"""
+    engine = OllamaEngine(model=MODEL, url=server.url, parallel=workers, log=lambda message: None,
+                          limiter=RateLimiter(1e6, 1e6))
+    if mode == 'bare':
+        # requests 模組的 get/post 與 Session 介面相同，但每次呼叫都建立新連線
+        engine.session = requests
+    texts = [[f"Line {i} of the benchmark document"] for i in range(requests_count)]
+
+    server.reset()
+    if mode == 'async':
+        pool = AsyncTranslationPool(lambda batch: engine.translate_batch_async(batch, 'zh-TW'), engine.event_loop(),
+                                    workers=workers)
+    else:
+        pool = TranslationPool(lambda batch: engine.translate_batch(batch, 'zh-TW'), workers=workers)
+    started = time.perf_counter()
+    results = pool.map(texts)
+    seconds = time.perf_counter() - started
+
+    ok = all(result[0].startswith('譯') for result in results)
+    # 每個工作槽平均花在一個請求上的時間，扣除伺服器刻意等待的延遲，即連線、序列化與排程的成本
+    overhead_ms = max(0.0, seconds * workers / requests_count - server.latency) * 1000
+    histograms = engine.metrics.report()['histograms']
+    return {
+        'mode': mode,
+        'ok': ok,
+        'requests': server.requests,
+        'connections': server.connections,
+        'seconds': round(seconds, 3),
+        'requests_per_second': round(requests_count / seconds, 1),
+        'overhead_ms': round(overhead_ms, 2),
+        'ttft_ms': round(histograms['ttft_seconds']['mean'] * 1000, 2) if 'ttft_seconds' in histograms else None,
+    }
+
+
+def measure_stops(token_delay):
+    """以不會自行結束的生成量測：失控輸出被截斷前的 token 數與耗時，以及取消後多久中止進行中的請求"""
+    server = StandIn(0.0, token_delay)
+    engine = OllamaEngine(model=MODEL, url=server.url, log=lambda message: None, limiter=RateLimiter(1e6, 1e6))
+    text = 'RUNAWAY line of the benchmark document'
+    
+    started = time.perf_counter()
+    translated = engine.translate(text, 'zh-TW')
+    runaway_seconds = time.perf_counter() - started
+    tokens = engine.metrics.counters.get('generated_tokens', 0)
+    
+    stop = threading.Event()
+    aborted_after = []
+    
+    def cancel_soon():
+        time.sleep(0.3)
+        stop.set()
+        cancelled_at = time.perf_counter()
+        engine.abort_requests()
+        worker.join()
+        aborted_after.append(time.perf_counter() - cancelled_at)
+    
+    def translate_until_cancelled():
+        try:
+            engine.translate(text, 'zh-TW', should_stop=stop.is_set)
+        except TranslationCancelled:
+            pass
+    
+    worker = threading.Thread(target=translate_until_cancelled)
+    worker.start()
+    cancel_soon()
+    server.stop()
+    return {
+        'runaway_tokens': tokens,
+        'runaway_seconds': round(runaway_seconds, 3),
+        'runaway_fell_back': translated == text,
+        'cancel_ms': round(aborted_after[0] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ollama client cost per request against a local stand-in server')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per mode (default: 500)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent requests (default: 8)')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Stand-in latency per request; 0 isolates the client cost (default: 0)')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='Stand-in delay per streamed token (default: 0)')
+    parser.add_argument('--mode', default=','.join(MODES), help=f"Comma-separated modes: {', '.join(MODES)}")
+    parser.add_argument('--stop-token-ms', type=float, default=50.0,
+                        help='Token delay of the endless generation used to time cancel and cutoff (default: 50)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    server = StandIn(args.latency_ms / 1000, args.token_ms / 1000)
+    print(f"{args.requests} requests, {args.workers} concurrent, stand-in latency {args.latency_ms:g} ms, "
+          f"{args.token_ms:g} ms/token")
+    print(f"{'mode':<8} {'requests':>8} {'connections':>11} {'seconds':>8} {'req/s':>8} {'overhead':>10} {'ttft':>10}")
+    results = []
+    for mode in args.mode.split(','):
+        if mode not in MODES:
+            parser.error(f"unknown mode: {mode}")
+        result = run(mode, server, args.requests, args.workers)
+        results.append(result)
+        status = '' if result['ok'] else '  FAILED'
+        print(f"{mode:<8} {result['requests']:>8} {result['connections']:>11} {result['seconds']:>7.2f}s "
+              f"{result['requests_per_second']:>8.1f} {result['overhead_ms']:>7.2f} ms {result['ttft_ms'] or 0:>7.2f} ms"
+              f"{status}")
+    server.stop()
+    
+    stops = measure_stops(args.stop_token_ms / 1000)
+    print(f"Runaway output cut off after {stops['runaway_tokens']} tokens ({stops['runaway_seconds']:.2f}s), "
+          f"{'source text kept' if stops['runaway_fell_back'] else 'partial output used'}")
+    print(f"Cancel aborted the in-flight request in {stops['cancel_ms']:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'requests': args.requests, 'workers': args.workers, 'latency_ms': args.latency_ms,
+                       'token_ms': args.token_ms, 'results': results, 'stops': stops}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：完整翻譯流程的吞吐量
+以 fitz 產生指定大小的合成 PDF（頁數、每頁 span 數、圖片、字型數），
+用內建的 mock 翻譯引擎（固定延遲、結果可重現、不連網）跑 PDFTranslatorCLI，
+輸出各階段耗時、每秒 span 數與峰值記憶體，並可存成 JSON 供不同版本比對
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pdf_translator import PDFTranslatorCLI, fitz
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 預設的文件大小：(頁數, 每頁 span 數, 每頁圖片數, 字型數)
+PRESETS = {
+    'small': (5, 40, 0, 1),
+    'medium': (50, 80, 1, 3),
+    'large': (200, 120, 2, 4),
+}
+MODES = ('staged', 'stream', 'parallel')
+# 比對基準時，這些參數都相同的情境才視為同一情境
+SCENARIO_KEYS = ('preset', 'mode', 'pages', 'spans', 'images', 'fonts', 'latency_ms', 'batch_size', 'workers',
+                 'apply_workers')
+PDF_FONTS = ['helv', 'tiro', 'cour', 'hebo', 'tibo', 'cobo']
+WORDS = ('device', 'power', 'supply', 'voltage', 'input', 'output', 'manual', 'safety', 'warning', 'connect',
+         'cable', 'module', 'install', 'remove', 'service', 'battery', 'display', 'setting', 'network', 'port')
+# 中日韓文原文（script='cjk'）：URL 編碼後每字 9 個位元組，用於檢查以請求大小為上限的引擎
+CJK_WORDS = ('裝置', '電源', '供應', '電壓', '輸入', '輸出', '手冊', '安全', '警告', '連接',
+             '纜線', '模組', '安裝', '移除', '維修', '電池', '顯示', '設定', '網路', '連接埠')
+
+
+def make_pdf(path, pages, spans, images, fonts, duplicate_ratio=0.1, image_size=400, seed=0, script='latin',
+             columns=1, background=False):
+    """產生合成 PDF：每頁 spans 個文字 span（約 duplicate_ratio 為重複的頁首頁尾）、images 張雜訊圖片，輪流使用 fonts 種字型；
+    script='cjk' 時原文改為中文並使用內建的 china-s 字型；columns 大於 1 時每行並排 columns 個單字 span（逐字定位的表格，同一欄的字相同），
+    background 時每頁先畫一個淺色底框"""
+    rng = random.Random(seed)
+    if script == 'cjk':
+        words, separator, fontnames = CJK_WORDS, '', ['china-s']
+        repeated = [f"第 {i} 章 操作手冊" for i in range(10)] + ["版權所有 2024 ACME 公司"]
+    else:
+        words, separator, fontnames = WORDS, ' ', PDF_FONTS[:max(1, fonts)]
+        repeated = [f"Chapter {i} - Operating Manual" for i in range(10)] + ["Copyright 2024 ACME Corp."]
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        if background:
+            page.draw_rect(fitz.Rect(10, 10, 585, 790), color=(0.5, 0.5, 0.5), fill=(0.95, 0.95, 1))
+        for i in range(images):
+            # 隨機雜訊無法有效壓縮，接近照片的解碼與儲存成本
+            pix = fitz.Pixmap(fitz.csRGB, image_size, image_size, rng.randbytes(image_size * image_size * 3), False)
+            top = 420 + i * 180
+            page.insert_image(fitz.Rect(300, top, 560, top + 170), pixmap=pix)
+        rows = -(-spans // max(1, columns))
+        line_height = min(18.0, 740.0 / max(1, rows))
+        fontsize = max(4.0, line_height * 0.7)
+        x = 40
+        for i in range(spans):
+            if columns > 1:
+                text = words[i % columns % len(words)]
+            elif rng.random() < duplicate_ratio:
+                text = rng.choice(repeated)
+            else:
+                text = separator.join(rng.choice(words) for _ in range(rng.randint(3, 8)))
+            fontname = fontnames[i % len(fontnames)]
+            if i % columns == 0:
+                x = 40
+            page.insert_text((x, 50 + i // columns * line_height), text, fontsize=fontsize, fontname=fontname)
+            if columns > 1:
+                x += fitz.get_text_length(text + ' ', fontname=fontname, fontsize=fontsize)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def run_scenario(scenario, input_pdf, queue):
+    """在獨立行程中翻譯 input_pdf，峰值記憶體才不會受其他情境與產生 PDF 的影響；結果放入 queue"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_pdf = os.path.join(tmp_dir, 'output.pdf')
+        input_size = os.path.getsize(input_pdf)
+    
+        mode = scenario['mode']
+        translator = PDFTranslatorCLI(
+            input_pdf, output_pdf, target_lang='zh-TW', engine='mock', workers=scenario['workers'], use_cache=False,
+            rate=1e6, max_rate=1e6, stream=mode == 'stream',
+            apply_workers=scenario['apply_workers'] if mode == 'parallel' else 1,
+            extract_workers=scenario['apply_workers'] if mode == 'parallel' else 1,
+            engine_options={'latency': scenario['latency_ms'] / 1000, 'batch_size': scenario['batch_size']}
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            ok = translator.process()
+            total_seconds = time.perf_counter() - started
+    
+        result = dict(scenario)
+        result.update(
+            ok=ok,
+            error=translator.result['error'],
+            input_bytes=input_size,
+            output_bytes=os.path.getsize(output_pdf) if ok else 0,
+            total_seconds=round(total_seconds, 3),
+            # 各階段耗時取自 RunMetrics；串流模式下翻譯在背景執行緒進行，各階段時間會重疊
+            stage_seconds=translator.result['metrics']['stages'] if ok else {},
+            segments=translator.result['segments'],
+            translated=translator.result['translated'],
+            requests=translator.result['metrics']['counters'].get('requests', 0) if ok else 0,
+            spans_per_second=round(translator.result['segments'] / total_seconds, 1) if total_seconds else 0.0,
+            peak_rss_mb=peak_rss_mb(),
+        )
+    queue.put(result)
+
+
+def peak_rss_mb():
+    """本行程與已結束子行程的峰值常駐記憶體 (MB)；沒有 resource 模組的平台返回 None"""
+    if resource is None:
+        return None
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為位元組
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak * unit / 1024 / 1024, 1)
+
+
+def run_isolated(scenario):
+    """在本行程產生合成 PDF，再以 spawn 啟動的新行程執行情境並返回結果"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_pdf = os.path.join(tmp_dir, 'input.pdf')
+        started = time.perf_counter()
+        make_pdf(input_pdf, scenario['pages'], scenario['spans'], scenario['images'], scenario['fonts'])
+        generate_seconds = time.perf_counter() - started
+        
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=run_scenario, args=(scenario, input_pdf, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+    result['generate_seconds'] = round(generate_seconds, 3)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """與基準 JSON 中參數相同的情境比對每秒 span 數與峰值記憶體，返回退步描述列表"""
+    def key(r):
+        return tuple(r[name] for name in SCENARIO_KEYS)
+    
+    previous = {key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if not before or not result['ok']:
+            continue
+        name = f"{result['preset']}/{result['mode']}"
+        if result['spans_per_second'] < before['spans_per_second'] * (1 - tolerance):
+            regressions.append(f"{name}: {before['spans_per_second']} -> {result['spans_per_second']} spans/s")
+        if result['peak_rss_mb'] and before.get('peak_rss_mb') and \
+                result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='End-to-end pipeline throughput on synthetic PDFs with a deterministic mock engine'
+    )
+    parser.add_argument('--preset', default='small,medium',
+                        help=f"Comma-separated document sizes: {', '.join(PRESETS)} (default: small,medium)")
+    parser.add_argument('--pages', type=int, help='Override the number of pages')
+    parser.add_argument('--spans', type=int, help='Override the text spans per page')
+    parser.add_argument('--images', type=int, help='Override the images per page')
+    parser.add_argument('--fonts', type=int, help=f'Override the number of source fonts (max {len(PDF_FONTS)})')
+    parser.add_argument('--mode', default='staged,stream',
+                        help=f"Comma-separated pipeline modes: {', '.join(MODES)} (default: staged,stream)")
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Mock engine latency per request (default: 5)')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Spans per mock engine request; 1 behaves like a per-span engine (default: 1)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent translation requests (default: 4)')
+    parser.add_argument('--apply-workers', type=int, default=2,
+                        help='Processes for the extract/apply stages in parallel mode (default: 2)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier --json run; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed throughput drop or memory growth as a fraction (default: 0.2)')
+    args = parser.parse_args()
+    
+    scenarios = []
+    for preset in args.preset.split(','):
+        pages, spans, images, fonts = PRESETS[preset.strip()]
+        for mode in args.mode.split(','):
+            if mode.strip() not in MODES:
+                parser.error(f"unknown mode: {mode}")
+            scenarios.append({
+                'preset': preset.strip(),
+                'mode': mode.strip(),
+                'pages': args.pages or pages,
+                'spans': args.spans or spans,
+                'images': images if args.images is None else args.images,
+                'fonts': args.fonts or fonts,
+                'latency_ms': args.latency_ms,
+                'batch_size': args.batch_size,
+                'workers': args.workers,
+                'apply_workers': args.apply_workers,
+            })
+    
+    print(f"Python {platform.python_version()} on {platform.platform()}, "
+          f"mock latency {args.latency_ms:g} ms, {args.workers} worker(s)")
+    print(f"{'scenario':<18} {'segments':>8} {'requests':>8} {'total':>8} {'spans/s':>9} {'peak MB':>8} {'out KB':>8}  "
+          f"stages")
+    results = []
+    for scenario in scenarios:
+        result = run_isolated(scenario)
+        results.append(result)
+        name = f"{result['preset']}/{result['mode']}"
+        if not result['ok']:
+            print(f"{name:<18} FAILED: {result['error']}")
+            continue
+        stages = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in result['stage_seconds'].items())
+        peak = f"{result['peak_rss_mb']:8.1f}" if result['peak_rss_mb'] is not None else f"{'n/a':>8}"
+        print(f"{name:<18} {result['segments']:>8} {result['requests']:>8} {result['total_seconds']:>7.2f}s "
+              f"{result['spans_per_second']:>9.1f} {peak} {result['output_bytes'] / 1024:>8.1f}  {stages}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'pymupdf': fitz.VersionBind,
+                       'platform': platform.platform(), 'results': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.compare}")
+    
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
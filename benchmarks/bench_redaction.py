@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：移除原文的時間
+比較逐 span 加白底覆蓋並以預設設定套用，與合併矩形後只移除文字的 redact_page；
+另檢查合併後的覆蓋區不會移除提取時略過的字元
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+
+from bench_pipeline import make_pdf
+from pdf_translator import extract_page_spans, redact_page
+
+
+def redact_per_span(page, rects):
+    """舊做法：每個 span 一個白底覆蓋區，圖片與線條也一併處理"""
+    for rect in rects:
+        page.add_redact_annot(fitz.Rect(rect), fill=(1, 1, 1))
+    page.apply_redactions()
+    return len(rects)
+
+
+def run(pdf_path, redact):
+    """移除全部頁面的原文，返回 (秒數, span 數, 覆蓋區數)"""
+    doc = fitz.open(pdf_path)
+    rects = [list(extract_page_spans(page, page.number).redact_rects()) for page in doc]
+    started = time.perf_counter()
+    areas = 0
+    for page, page_rects in zip(doc, rects):
+        areas += redact(page, page_rects)
+    elapsed = time.perf_counter() - started
+    doc.close()
+    return elapsed, sum(len(page_rects) for page_rects in rects), areas
+
+
+def check_skipped_glyphs():
+    """大字旁接小字、小字上方有提取時略過的單字元上標：合併覆蓋區後上標必須留在頁面上，返回是否通過"""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 100), "Big", fontsize=24)
+    x = 50 + fitz.get_text_length("Big", fontsize=24)
+    page.insert_text((x, 100), "ab", fontsize=8)
+    page.insert_text((x + 3, 88), "5", fontsize=5)
+    redact_page(page, list(extract_page_spans(page, 0).redact_rects()))
+    remaining = page.get_text().strip()
+    doc.close()
+    return remaining == '5'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Redaction cost: one box per span vs merged text-only redaction')
+    parser.add_argument('pdf', nargs='?', help='PDF to measure (default: generate a synthetic dense PDF)')
+    parser.add_argument('--pages', type=int, default=5, help='Pages of the synthetic PDF (default: 5)')
+    args = parser.parse_args()
+    
+    pdf_path = args.pdf
+    tmp_dir = None
+    if not pdf_path:
+        tmp_dir = tempfile.TemporaryDirectory()
+        pdf_path = os.path.join(tmp_dir.name, 'dense.pdf')
+        # 每頁 100 行、每行 12 個輪流換字型的單字 span，模擬逐字定位的排版輸出
+        make_pdf(pdf_path, args.pages, 100 * 12, 0, 3, columns=12, background=True)
+    
+    span_time, spans, _ = run(pdf_path, redact_per_span)
+    merged_time, _, areas = run(pdf_path, redact_page)
+    
+    print(f"PDF: {pdf_path}")
+    print(f"per span:    {span_time:7.3f}s, {spans} redaction areas")
+    print(f"merged text: {merged_time:7.3f}s, {areas} redaction areas")
+    print(f"Speedup:     {span_time / max(merged_time, 1e-9):7.1f}x")
+    
+    if tmp_dir:
+        tmp_dir.cleanup()
+    
+    if not check_skipped_glyphs():
+        print("FAILED: merged redaction removed a glyph skipped during extraction")
+        sys.exit(1)
+    print("Skipped glyphs outside the span rectangles are kept")
+
+
+if __name__ == "__main__":
+    main()
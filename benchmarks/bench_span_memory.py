@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：每個翻譯單元的記憶體用量
+比較舊版「每個 span 一個 dict」與 SpanTable 欄位式儲存
+"""
+
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_translator import SpanTable
+
+
+def synthetic_spans(count, seed=0):
+    """產生模擬 PDF 的 span：約三成為重複的頁首、頁尾與表頭"""
+    rng = random.Random(seed)
+    repeated = [f"Chapter {i} - Operating Manual" for i in range(20)] + ["Copyright 2024 ACME Corp."]
+    spans = []
+    for i in range(count):
+        if rng.random() < 0.3:
+            text = rng.choice(repeated)
+        else:
+            text = f"Paragraph {i} of the regulatory filing, clause {rng.randint(1, 999)}."
+        x0 = rng.uniform(36, 400)
+        y0 = rng.uniform(36, 760)
+        size = rng.choice((8.0, 9.5, 10.0, 11.0, 14.0))
+        spans.append((text, (x0, y0, x0 + rng.uniform(40, 200), y0 + size * 1.2), size, rng.choice((0, 0x333333, 0xFF0000))))
+    return spans
+
+
+def measure(build):
+    """返回 build() 建立的物件所佔用的位元組數"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def build_dicts(spans, spans_per_page):
+    # 與舊版 process() 相同的資料形狀：每個 span 一個 dict；文字以新字串模擬從 PDF 解析出的物件
+    pages = []
+    for start in range(0, len(spans), spans_per_page):
+        texts = []
+        for text, bbox, size, color in spans[start:start + spans_per_page]:
+            texts.append({
+                'page_num': start // spans_per_page,
+                'bbox': tuple(float(v) for v in bbox),
+                'text': ''.join(list(text)),
+                'size': float(size),
+                'color': int(color),
+                'translated': ''.join(list(text))
+            })
+        pages.append((start // spans_per_page, texts))
+    return pages
+
+
+def build_tables(spans, spans_per_page):
+    pages = []
+    for start in range(0, len(spans), spans_per_page):
+        table = SpanTable(start // spans_per_page)
+        for text, bbox, size, color in spans[start:start + spans_per_page]:
+            table.append(''.join(list(text)), bbox, size, color)
+        table.translated = [''.join(list(text)) for text in table.text]
+        pages.append((table.page_num, table))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per span: dict records vs SpanTable')
+    parser.add_argument('--spans', type=int, default=100000, help='Number of spans (default: 100000)')
+    parser.add_argument('--spans-per-page', type=int, default=60, help='Spans per page (default: 60)')
+    args = parser.parse_args()
+    
+    spans = synthetic_spans(args.spans)
+    # 所有 span 共用同一字串時，量到的是排除文字內容後的結構開銷
+    empty = [('x', bbox, size, color) for _, bbox, size, color in spans]
+    
+    print(f"Spans: {args.spans} ({args.spans_per_page} per page)")
+    for label, data in (("including text", spans), ("structure only", empty)):
+        dict_bytes, _ = measure(lambda: build_dicts(data, args.spans_per_page))
+        table_bytes, _ = measure(lambda: build_tables(data, args.spans_per_page))
+        print(f"\n[{label}]")
+        print(f"dict records: {dict_bytes / args.spans:8.1f} bytes/span ({dict_bytes / 1024 / 1024:.1f} MB)")
+        print(f"SpanTable:    {table_bytes / args.spans:8.1f} bytes/span ({table_bytes / 1024 / 1024:.1f} MB)")
+        print(f"Saving:       {(1 - table_bytes / dict_bytes) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+基準測試：CLI 啟動時間
+量測直譯器啟動、匯入 pdf_translator、--version、--help 與提取第一頁文字所需的時間（各自啟動新行程），
+可將結果存成 JSON，之後以 --compare 比對，超出容許範圍時以結束碼 1 回報退步
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'pdf_translator.py')
+
+FIRST_PAGE_SCRIPT = """
+import sys
+sys.path.insert(0, {root!r})
+import pdf_translator
+doc = pdf_translator.fitz.open({pdf!r})
+pdf_translator.extract_page_spans(doc[0], 0)
+"""
+
+
+def make_pdf(path, pages=50):
+    """以 bench_pipeline.make_pdf 產生多頁純文字 PDF；在子行程中建立，避免本行程先載入 PyMuPDF"""
+    script = (
+        "import sys\n"
+        f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+        "from bench_pipeline import make_pdf\n"
+        f"make_pdf({path!r}, {pages}, 40, 0, 1)\n"
+    )
+    subprocess.run([sys.executable, '-c', script], check=True)
+
+
+def measure(command, runs):
+    """執行命令 runs 次，返回耗時中位數（毫秒）"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=ROOT)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def slowest_imports(count):
+    """以 -X importtime 找出匯入 pdf_translator 時最耗時的模組，返回 [(累計微秒, 模組), ...]"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import pdf_translator'],
+        capture_output=True, text=True, cwd=ROOT
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative_us), name.rstrip()))
+    return sorted(entries, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI startup time: imports, --version/--help and first extracted page')
+    parser.add_argument('--runs', type=int, default=7, help='Runs per measurement; the median is reported (default: 7)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON from an earlier --json run; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown against the baseline as a fraction (default: 0.2)')
+    parser.add_argument('--top', type=int, default=0, help='Also list the N slowest imports of pdf_translator')
+    args = parser.parse_args()
+    
+    tmp_dir = tempfile.TemporaryDirectory()
+    pdf_path = os.path.join(tmp_dir.name, 'startup.pdf')
+    make_pdf(pdf_path)
+    
+    python = sys.executable
+    commands = {
+        'interpreter': [python, '-c', 'pass'],
+        'import': [python, '-c', 'import pdf_translator'],
+        'version': [python, CLI, '--version'],
+        'help': [python, CLI, '--help'],
+        'first_page': [python, '-c', FIRST_PAGE_SCRIPT.format(root=ROOT, pdf=pdf_path)],
+    }
+    results = {name: measure(command, args.runs) for name, command in commands.items()}
+    tmp_dir.cleanup()
+    
+    print(f"Python {platform.python_version()} on {platform.platform()}, median of {args.runs} runs")
+    for name, ms in results.items():
+        print(f"  {name:<12} {ms:8.1f} ms")
+    
+    if args.top:
+        print("Slowest imports (cumulative):")
+        for cumulative_us, name in slowest_imports(args.top):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'runs': args.runs, 'results_ms': results}, f, indent=2)
+        print(f"Results written to {args.json}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results_ms']
+        regressions = []
+        for name, ms in results.items():
+            if name in baseline and ms > baseline[name] * (1 + args.tolerance):
+                regressions.append(f"{name}: {baseline[name]:.1f} -> {ms:.1f} ms")
+        if regressions:
+            print("Startup regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,27 +4,2063 @@ PDF翻譯工具 - CLI版本
 支持命令行參數和多種翻譯選項
 """
 
-import fitz
+import copy
+import importlib
+import importlib.util
 import os
 import time
 import shutil
 import sys
 import argparse
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import quote_plus
+import hashlib
+import json
+import tempfile
+from collections import deque
+import re
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+
+class _LazyModule:
+    """第一次存取屬性時才匯入的模組代理；取過的屬性會快取在代理上"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+
+# PyMuPDF 載入約需 0.1 秒；--help、--version 與只規劃批次的路徑用不到，真正開啟 PDF 時才匯入
+fitz = _LazyModule('fitz')
+
+
+def configure_stdout():
+    """Windows 主控台改以 UTF-8 輸出；GUI 以無控制台模式打包時 sys.stdout 為 None，此時不需重新包裝"""
+    if sys.platform == 'win32' and getattr(sys.stdout, 'buffer', None) is not None:
+        import codecs
+        sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
+
+
+# 目標語言代碼對應的語言名稱（用於 LLM 提示詞）
+LANG_NAMES = {
+    'zh-TW': '繁體中文',
+    'zh-CN': '简体中文',
+    'en': 'English',
+    'ja': '日本語',
+    'ko': '한국어',
+    'fr': 'français',
+    'de': 'Deutsch',
+    'es': 'español',
+    'pt': 'português',
+    'ru': 'русский'
+}
+
+_NUMBERED_LINE = re.compile(r'^\s*\[(\d+)\]\s?(.*)$')
+
+
+def estimate_tokens(text):
+    """粗略估計文本的 token 數（UTF-8 位元組數 / 3）"""
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def clean_llm_output(translated):
+    """清理 LLM 輸出中多餘的引號與標籤"""
+    translated = translated.strip()
+    if translated:
+        # 移除開頭和結尾的引號
+        translated = translated.strip('"\'')
+        # 如果翻譯結果包含"Translation:"等標籤，移除它
+        if translated.lower().startswith('translation:'):
+            translated = translated[12:].strip()
+        # 移除可能的換行符號
+        translated = translated.strip()
+    return translated
+
+
+def build_batch_prompt(texts, target_lang_name):
+    """將多段文本編號後合併成單一翻譯提示詞"""
+    numbered = '\n'.join(f"[{i}] {' '.join(text.split())}" for i, text in enumerate(texts, 1))
+    return f"""You are a professional translator. Translate each numbered line below to {target_lang_name}.
+Rules:
+- Output exactly one line per input line, keeping its [number] prefix
+- Only provide the translations
+- Do not include any explanations, notes, or the original text
+- Maintain the original meaning and tone
+- Keep proper nouns and technical terms appropriate
+
+Lines to translate:
+{numbered}
+
+Translations:"""
+
+
+def parse_numbered_response(response, count):
+    """解析編號回應，返回長度為 count 的列表；無法對齊的項目為 None"""
+    found = {}
+    current = None
+    for line in response.splitlines():
+        match = _NUMBERED_LINE.match(line)
+        if match:
+            current = int(match.group(1))
+            found[current] = match.group(2)
+        elif current is not None and line.strip():
+            found[current] += ' ' + line.strip()
+    
+    results = []
+    for i in range(1, count + 1):
+        translated = clean_llm_output(found.get(i, ''))
+        results.append(translated or None)
+    return results
+
+
+class RateLimiter:
+    """令牌桶限速器：成功時加性提速，遇到 429/5xx 或例外時乘性降速 (AIMD)"""
+
+    def __init__(self, rate, max_rate, min_rate=0.2, increase=0.1, decrease=0.5):
+        self.max_rate = max(rate, max_rate)
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.increase = increase
+        self.decrease = decrease
+        self.successes = 0
+        self.failures = 0
+        self._tokens = 1.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_engine(cls, engine, rate=None, max_rate=None):
+        """依引擎建立限速器，未指定的參數使用引擎宣告的 default_rate"""
+        default_rate, default_max = ENGINES[engine].default_rate if engine in ENGINES else (2.0, 20.0)
+        rate = rate or default_rate
+        return cls(rate, max_rate or max(default_max, rate))
+
+    def _reserve(self):
+        """嘗試取得一個令牌；取得時返回 0，否則返回需等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(1.0, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+    def acquire(self):
+        """阻塞直到取得一個請求令牌"""
+        while True:
+            delay = self._reserve()
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """acquire 的 asyncio 版本：等待時讓出事件迴圈"""
+        import asyncio
+        while True:
+            delay = self._reserve()
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def on_success(self):
+        """請求成功：加性提速"""
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self):
+        """請求被限流或失敗：乘性降速並清空令牌"""
+        with self._lock:
+            self.failures += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_response(self, status_code):
+        """依 HTTP 狀態碼調整速率"""
+        if status_code == 429 or status_code >= 500:
+            self.on_failure()
+        elif status_code < 400:
+            self.on_success()
+
+
+class TranslationPool:
+    """有界並行翻譯池：最多同時保留 workers 個請求，並依原始順序回收結果；
+    多個翻譯池同時執行時（串流模式的各頁），可共用 slots（threading.Semaphore）限制合計的請求數"""
+
+    def __init__(self, translate_fn, workers=1, slots=None):
+        self.translate_fn = translate_fn
+        self.workers = max(1, int(workers))
+        self.slots = slots
+        self.elapsed = 0.0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name, busy):
+        with self._lock:
+            count, total_busy = self._stats.get(name, (0, 0.0))
+            self._stats[name] = (count + 1, total_busy + busy)
+
+    def _run_one(self, text):
+        start = time.perf_counter()
+        try:
+            return self.translate_fn(text)
+        finally:
+            self._record(threading.current_thread().name, time.perf_counter() - start)
+
+    @contextmanager
+    def _submitter(self):
+        """提供 submit(text) -> Future；離開時所有請求都已結束"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='translate') as executor:
+            yield lambda text: executor.submit(self._run_one, text)
+
+    def map(self, texts, on_progress=None, should_stop=None, on_result=None):
+        """翻譯 texts 並依原順序返回結果；每完成一項呼叫 on_result(索引, 結果)，should_stop() 為真時停止派發新請求"""
+        total = len(texts)
+        results = [None] * total
+        self._stats = {}
+        started = time.perf_counter()
+        
+        with self._submitter() as submit:
+            pending = {}
+            next_index = 0
+            completed = 0
+            while next_index < total or pending:
+                while next_index < total and len(pending) < self.workers:
+                    if should_stop and should_stop():
+                        break
+                    if self.slots is not None:
+                        # 由完成回呼歸還，不必等本執行緒回收結果
+                        self.slots.acquire()
+                    future = submit(texts[next_index])
+                    if self.slots is not None:
+                        future.add_done_callback(lambda _: self.slots.release())
+                    pending[future] = next_index
+                    next_index += 1
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    results[index] = future.result()
+                    if on_result:
+                        on_result(index, results[index])
+                    completed += 1
+                    if on_progress:
+                        on_progress(completed, total)
+        
+        self.elapsed = time.perf_counter() - started
+        return results
+
+    def summary(self):
+        """返回各工作執行緒的吞吐量統計文字"""
+        lines = []
+        wall = self.elapsed or 1e-9
+        for name in sorted(self._stats):
+            count, busy = self._stats[name]
+            avg_ms = busy / count * 1000 if count else 0.0
+            lines.append(f"{name}: {count} items, {count / wall:.2f} seg/s, avg {avg_ms:.0f} ms/request")
+        return lines
+
+
+class AsyncTranslationPool(TranslationPool):
+    """以 asyncio 協程取代工作執行緒的翻譯池：translate_fn 為協程函式，在 loop（背景執行緒的事件迴圈）上並行執行"""
+
+    def __init__(self, translate_fn, loop, workers=1, slots=None):
+        super().__init__(translate_fn, workers, slots)
+        self.loop = loop
+
+    async def _run_one_async(self, text):
+        start = time.perf_counter()
+        try:
+            return await self.translate_fn(text)
+        finally:
+            self._record('asyncio', time.perf_counter() - start)
+
+    @contextmanager
+    def _submitter(self):
+        import asyncio
+        futures = []
+        
+        def submit(text):
+            future = asyncio.run_coroutine_threadsafe(self._run_one_async(text), self.loop)
+            futures.append(future)
+            return future
+        
+        try:
+            yield submit
+        finally:
+            wait(futures)
+
+
+# 請求耗時直方圖的區間上限（秒）
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 生成速度直方圖的區間上限（每秒 token 數）
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def peak_memory_bytes():
+    """本行程的峰值常駐記憶體（位元組），無法取得時返回 None"""
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 的 ru_maxrss 單位為 KB，macOS 為位元組
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                       [(name, ctypes.c_size_t) for name in (
+                           'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                           'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage'
+                       )]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_current_process.restype = wintypes.HANDLE
+        get_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+        if get_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+
+def _escape_label(value):
+    """Prometheus 標籤值的跳脫：反斜線、雙引號與換行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RunMetrics:
+    """單次執行的指標：各階段耗時、請求耗時直方圖與計數器；每次記錄只是一次加法，可常駐開啟"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.seconds = 0.0
+        self.stages = {}  # 階段名稱 -> 累計秒數，依第一次進入的順序
+        self.counters = {}
+        self.histograms = {}  # 名稱 -> [各區間計數..., 超出最後區間的計數]
+        self.histogram_sums = {}
+        self.histogram_bounds = {}  # 名稱 -> 區間上限
+        self.peak_memory = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """計時 with 區塊並累加到 name 階段"""
+        with self._lock:
+            # 先登記名稱，巢狀的子階段（例如 apply 中的 redact）才會排在外層之後
+            self.stages.setdefault(name, 0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, bounds=LATENCY_BUCKETS):
+        """記錄一次觀測值到 name 直方圖；預設為耗時（秒），其他單位以 bounds 指定區間上限"""
+        index = bisect_left(bounds, value)
+        with self._lock:
+            buckets = self.histograms.get(name)
+            if buckets is None:
+                buckets = self.histograms[name] = [0] * (len(bounds) + 1)
+                self.histogram_bounds[name] = bounds
+            buckets[index] += 1
+            self.histogram_sums[name] = self.histogram_sums.get(name, 0.0) + value
+
+    def finish(self):
+        """結束計時並記錄峰值記憶體"""
+        self.seconds = time.time() - self.started
+        self.peak_memory = peak_memory_bytes()
+
+    def merge(self, other):
+        """把另一次執行（例如批次中的一份文件）的指標加總進來"""
+        with self._lock:
+            for name, seconds in other.stages.items():
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, buckets in other.histograms.items():
+                self.histogram_bounds.setdefault(name, other.histogram_bounds[name])
+                mine = self.histograms.setdefault(name, [0] * len(buckets))
+                for i, count in enumerate(buckets):
+                    mine[i] += count
+                self.histogram_sums[name] = self.histogram_sums.get(name, 0.0) + other.histogram_sums[name]
+
+    def _quantile(self, buckets, bounds, q):
+        """由直方圖估計分位數，返回所在區間的上限（超出最後區間時返回 None）"""
+        target = q * sum(buckets)
+        cumulative = 0
+        for bound, count in zip(bounds, buckets):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return None
+
+    def report(self, **info):
+        """返回可寫成 JSON 的指標摘要；info 為額外的描述欄位（輸入檔、引擎等）"""
+        with self._lock:
+            histograms = {}
+            for name, buckets in self.histograms.items():
+                count = sum(buckets)
+                bounds = self.histogram_bounds[name]
+                histograms[name] = {
+                    'count': count,
+                    'sum': round(self.histogram_sums[name], 4),
+                    'mean': round(self.histogram_sums[name] / count, 4) if count else 0.0,
+                    'p50': self._quantile(buckets, bounds, 0.5),
+                    'p90': self._quantile(buckets, bounds, 0.9),
+                    'p99': self._quantile(buckets, bounds, 0.99),
+                    'buckets': dict(zip([str(bound) for bound in bounds] + ['+Inf'], buckets))
+                }
+            return dict(info,
+                        started=time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                        seconds=round(self.seconds, 3),
+                        stages={name: round(seconds, 3) for name, seconds in self.stages.items()},
+                        counters=dict(self.counters),
+                        histograms=histograms,
+                        peak_memory_bytes=self.peak_memory)
+
+    def write_json(self, path, **info):
+        """將 report() 寫成 JSON 檔"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**info), f, ensure_ascii=False, indent=2)
+
+    def prometheus_text(self, **labels):
+        """返回 Prometheus 文字格式的指標；labels 加在每條時間序列上"""
+        def series(name, value, **extra):
+            pairs = dict(labels, **extra)
+            label_text = ','.join(f'{key}="{_escape_label(text)}"' for key, text in pairs.items())
+            return f"pdf_translator_{name}{{{label_text}}} {value}" if label_text else f"pdf_translator_{name} {value}"
+
+        lines = [
+            '# HELP pdf_translator_run_seconds Wall time of the last run.',
+            '# TYPE pdf_translator_run_seconds gauge',
+            series('run_seconds', round(self.seconds, 3)),
+            '# HELP pdf_translator_last_run_timestamp_seconds Unix time the last run started.',
+            '# TYPE pdf_translator_last_run_timestamp_seconds gauge',
+            series('last_run_timestamp_seconds', round(self.started)),
+            '# HELP pdf_translator_stage_seconds Wall time spent in each pipeline stage.',
+            '# TYPE pdf_translator_stage_seconds gauge',
+        ]
+        with self._lock:
+            lines.extend(series('stage_seconds', round(seconds, 3), stage=name) for name, seconds in self.stages.items())
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'# TYPE pdf_translator_{name}_total counter')
+                lines.append(series(f'{name}_total', value))
+            for name, buckets in sorted(self.histograms.items()):
+                lines.append(f'# TYPE pdf_translator_{name} histogram')
+                cumulative = 0
+                for bound, count in zip([str(bound) for bound in self.histogram_bounds[name]] + ['+Inf'], buckets):
+                    cumulative += count
+                    lines.append(series(f'{name}_bucket', cumulative, le=bound))
+                lines.append(series(f'{name}_sum', round(self.histogram_sums[name], 4)))
+                lines.append(series(f'{name}_count', cumulative))
+        if self.peak_memory is not None:
+            lines.append('# TYPE pdf_translator_peak_memory_bytes gauge')
+            lines.append(series('peak_memory_bytes', self.peak_memory))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path, **labels):
+        """以 Prometheus textfile 格式寫出（供 node_exporter 的 textfile collector 收集）；先寫暫存檔再替換"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text(**labels))
+        os.replace(tmp_path, path)
+
+
+class EngineUnavailable(Exception):
+    """翻譯引擎無法使用（服務未啟動、沒有模型等）；hint 為給使用者的處理建議"""
+
+    def __init__(self, message, hint=None):
+        super().__init__(message)
+        self.hint = hint
+
+
+class TranslationRequestFailed(Exception):
+    """翻譯請求失敗（連線問題、逾時或非 200 回應），與送出的內容無關"""
+
+
+# 已註冊的翻譯引擎：名稱 -> 類別
+ENGINES = {}
+
+
+def register_engine(cls):
+    """類別裝飾器：以 cls.name 註冊翻譯引擎，之後即可用 --engine 選用"""
+    ENGINES[cls.name] = cls
+    return cls
+
+
+def create_engine(name, **options):
+    """建立已註冊的翻譯引擎；options 傳給引擎建構子，引擎用不到的選項會被忽略"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name}")
+    return ENGINES[name](**options)
+
+
+def plan_batches(texts, max_items=1, max_chars=None, max_tokens=None):
+    """依引擎能力將文本依序分組為請求，返回索引列表的列表；單段超過上限時自成一組"""
+    batches = []
+    current = []
+    current_chars = 0
+    current_tokens = 0
+    for idx, text in enumerate(texts):
+        chars = len(text)
+        tokens = estimate_tokens(text) if max_tokens else 0
+        if current and (len(current) >= max_items
+                        or (max_chars and current_chars + chars > max_chars)
+                        or (max_tokens and current_tokens + tokens > max_tokens)):
+            batches.append(current)
+            current = []
+            current_chars = 0
+            current_tokens = 0
+        current.append(idx)
+        current_chars += chars
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class TranslationEngine:
+    """翻譯引擎介面：子類別實作 setup 與 translate_batch，並以類別屬性宣告能力；流程依能力切分請求與並行數"""
+
+    name = None
+    requirement = None  # 需要的套件（pip 安裝名稱），缺少時提示使用者
+    max_batch_size = 1  # 單一請求最多包含的段數
+    max_chars = None  # 單一請求的原文字元上限，None 表示不限
+    max_tokens = None  # 單一請求的估計 token 上限，None 表示不限
+    max_concurrency = None  # 同時進行的請求上限，None 表示只受 --workers 限制
+    supports_async = False  # 是否實作 translate_batch_async（可用 --async 以單一事件迴圈送出請求）
+    default_rate = (2.0, 20.0)  # 限速器的 (初始速率, 最高速率)，單位為每秒請求數
+
+    def __init__(self, limiter=None, log=print, **options):
+        self.limiter = limiter or RateLimiter(*self.default_rate)
+        self.log = log
+        self.metrics = RunMetrics()  # 呼叫端未指定 metrics 時使用
+        self.model = None  # 翻譯記憶與檢查點的鍵之一；沒有模型之分的引擎為 None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def setup(self):
+        """連線或載入引擎；缺少套件時拋出 ImportError，其他問題拋出 EngineUnavailable"""
+
+    def capabilities(self):
+        """返回引擎能力的描述"""
+        return {
+            'name': self.name,
+            'max_batch_size': self.max_batch_size,
+            'max_chars': self.max_chars,
+            'max_tokens': self.max_tokens,
+            'max_concurrency': self.max_concurrency,
+            'async': self.supports_async
+        }
+
+    def plan(self, texts):
+        """將 texts 依本引擎的能力分組為請求，返回索引列表的列表"""
+        return plan_batches(texts, self.max_batch_size, self.max_chars, self.max_tokens)
+
+    def concurrency(self, workers):
+        """返回實際使用的並行請求數"""
+        return max(1, min(workers, self.max_concurrency or workers))
+
+    def translate_batch(self, texts, target_lang, metrics=None, should_stop=None):
+        """以一次（或盡量少的）請求翻譯 texts，依序返回譯文；失敗的段落返回原文。
+        should_stop() 為真時，能中途中止請求的引擎拋出 TranslationCancelled"""
+        raise NotImplementedError
+
+    def translate(self, text, target_lang, metrics=None, should_stop=None):
+        return self.translate_batch([text], target_lang, metrics, should_stop)[0]
+
+    async def translate_batch_async(self, texts, target_lang, metrics=None, should_stop=None):
+        """translate_batch 的 asyncio 版本；supports_async 為真的引擎才需實作"""
+        raise NotImplementedError
+
+    def abort_requests(self):
+        """中止 should_stop() 已為真的進行中請求（由停止按鈕或取消工作的執行緒呼叫）；不支援的引擎不做任何事"""
+
+    def event_loop(self):
+        """返回執行非同步請求的事件迴圈，首次呼叫時在背景執行緒啟動；同一引擎的所有文件共用"""
+        with self._loop_lock:
+            if self._loop is None:
+                import asyncio
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=f'{self.name}-asyncio', daemon=True).start()
+        return self._loop
+
+
+@register_engine
+class GoogleEngine(TranslationEngine):
+    """googletrans（Google 翻譯網頁介面）：多段文本以換行合併為一個請求，譯文再依換行拆回；行數對不上時對半重試"""
+
+    name = 'google'
+    requirement = 'googletrans==3.1.0a0'
+    max_batch_size = 100
+    max_chars = 5000  # 網頁介面單次請求的文字上限（含分隔換行）
+    # googletrans 以 GET 查詢參數送出原文，URL 編碼後的長度才是請求真正的大小：
+    # 中日韓文每字編碼為 9 個位元組，5000 字會變成約 45 KB 的 URL；上限保留給其他參數並低於常見的 8 KB 請求行限制
+    max_query_bytes = 6000
+    default_rate = (2.0, 20.0)
+    SEPARATOR = '\n'
+
+    def __init__(self, batch_chars=5000, **options):
+        super().__init__(**options)
+        self.client = None
+        # 合併請求的字元預算；0 表示逐段翻譯
+        self.max_chars = min(batch_chars, type(self).max_chars) if batch_chars > 0 else type(self).max_chars
+        self.max_batch_size = type(self).max_batch_size if batch_chars > 0 else 1
+
+    def setup(self):
+        from googletrans import Translator
+        # 非 200 回應預設會靜默返回原文，改為拋出例外才能計入失敗並調整速率
+        self.client = Translator(raise_exception=True)
+
+    def capabilities(self):
+        return dict(super().capabilities(), max_query_bytes=self.max_query_bytes)
+
+    def plan(self, texts):
+        # 每段另需一個分隔換行；先依字元預算分組，再依 URL 編碼後的長度（與 httpx 相同的 quote_plus）細分
+        texts = [text + self.SEPARATOR for text in texts]
+        batches = []
+        for batch in plan_batches(texts, self.max_batch_size, self.max_chars):
+            encoded = [quote_plus(texts[i]) for i in batch]
+            batches.extend([batch[j] for j in part]
+                           for part in plan_batches(encoded, self.max_batch_size, self.max_query_bytes))
+        return batches
+
+    def _request(self, text, target_lang, metrics):
+        """送出一個翻譯請求並返回譯文；失敗時拋出 TranslationRequestFailed"""
+        self.limiter.acquire()
+        metrics.count('requests')
+        started = time.perf_counter()
+        try:
+            translated = self.client.translate(text, dest=target_lang).text
+        except Exception as e:
+            # googletrans 對非 200 回應（含 429）只拋出一般的 Exception，連線問題則是 httpx/httpcore 的例外；
+            # 統一轉為 TranslationRequestFailed，呼叫端才能與行數錯位區分
+            self.limiter.on_failure()
+            metrics.count('request_errors')
+            raise TranslationRequestFailed(e) from e
+        finally:
+            metrics.observe('request_seconds', time.perf_counter() - started)
+        self.limiter.on_success()
+        return translated
+
+    def translate_batch(self, texts, target_lang, metrics=None, should_stop=None):
+        metrics = metrics or self.metrics
+        if len(texts) == 1:
+            try:
+                return [self._request(texts[0], target_lang, metrics)]
+            except TranslationRequestFailed as e:
+                self.log(f"   [WARNING] Translation failed: {e}")
+                return [texts[0]]
+        
+        # 段落內的換行會破壞對齊，合併前先換成空白
+        joined = self.SEPARATOR.join(' '.join(text.splitlines()) for text in texts)
+        try:
+            lines = self._request(joined, target_lang, metrics).strip(self.SEPARATOR).split(self.SEPARATOR)
+        except TranslationRequestFailed as e:
+            # 限流、伺服器錯誤與連線問題都與批次內容無關，拆開重試只會在限流時放大請求數
+            self.log(f"   [WARNING] Translation failed: {e}")
+            return list(texts)
+        if len(lines) == len(texts):
+            return [line.strip() or text for line, text in zip(lines, texts)]
+        self.log(f"   [WARNING] Batch returned {len(lines)}/{len(texts)} lines, splitting")
+        
+        # 行數對不上：對半拆開重試，最終只有出問題的段落會逐段翻譯
+        metrics.count('batch_splits')
+        middle = len(texts) // 2
+        return (self.translate_batch(texts[:middle], target_lang, metrics, should_stop)
+                + self.translate_batch(texts[middle:], target_lang, metrics, should_stop))
+
+
+class GenerationStream:
+    """累積 Ollama 的串流回應（每行一個 JSON），量測首個 token 的時間與生成速度；輸出超過 max_tokens 時要求停止"""
+
+    def __init__(self, max_tokens):
+        self.max_tokens = max_tokens
+        self.started = time.perf_counter()
+        self.first_token = None  # 送出請求到第一個 token 的秒數
+        self.parts = []
+        self.tokens = 0
+        self.eval_count = None  # 伺服器回報的生成 token 數與耗時（奈秒），只在完整結束時提供
+        self.eval_duration = None
+        self.cut_off = False
+        self._buffer = b''
+
+    def feed_data(self, data):
+        """處理收到的位元組（可能含不完整的行），返回是否繼續讀取"""
+        *lines, self._buffer = (self._buffer + data).split(b'\n')
+        return all(self.feed(line) for line in lines)
+
+    def feed(self, line):
+        """處理一行回應，返回是否繼續讀取；結束行之後仍繼續讀到串流結束，連線才能放回連線池"""
+        if not line.strip():
+            return True
+        chunk = json.loads(line)
+        if chunk.get('error'):
+            raise RuntimeError(chunk['error'])
+        piece = chunk.get('response', '')
+        if piece:
+            if self.first_token is None:
+                self.first_token = time.perf_counter() - self.started
+            self.parts.append(piece)
+            self.tokens += 1  # Ollama 每個串流片段為一個 token
+        if chunk.get('done'):
+            self.eval_count = chunk.get('eval_count')
+            self.eval_duration = chunk.get('eval_duration')
+            self.cut_off = chunk.get('done_reason') == 'length'
+            return True
+        if self.tokens >= self.max_tokens:
+            self.cut_off = True
+            return False
+        return True
+
+    @property
+    def text(self):
+        return ''.join(self.parts)
+
+    def record(self, metrics):
+        """記錄首個 token 時間、生成 token 數、每秒 token 數與提前停止次數"""
+        if self.first_token is None:
+            return
+        metrics.observe('ttft_seconds', self.first_token)
+        tokens = self.eval_count or self.tokens
+        if self.eval_duration:
+            seconds = self.eval_duration / 1e9
+        else:
+            seconds = time.perf_counter() - self.started - self.first_token
+        metrics.count('generated_tokens', tokens)
+        if seconds > 0:
+            metrics.observe('tokens_per_second', tokens / seconds, TOKEN_RATE_BUCKETS)
+        if self.cut_off:
+            metrics.count('runaway_cutoffs')
+
+
+@register_engine
+class OllamaEngine(TranslationEngine):
+    """本機 Ollama LLM：多段文本合併成一個編號提示詞，無法對齊的段落改為逐段翻譯；請求經由共用連線池送出"""
+
+    name = 'ollama'
+    requirement = 'requests'
+    max_batch_size = 50
+    max_concurrency = 4  # Ollama 預設最多同時處理 4 個請求（OLLAMA_NUM_PARALLEL），更多只會在伺服器端排隊
+    supports_async = True
+    default_rate = (10.0, 200.0)
+    url = 'http://localhost:11434'
+    GENERATE_OPTIONS = {
+        'temperature': 0.3,  # 降低隨機性，提高準確性
+        'top_p': 0.9
+    }
+
+    def __init__(self, model=None, batch_tokens=1000, url=None, parallel=None, **options):
+        super().__init__(**options)
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.model = model  # 未指定時在 setup 自動選擇
+        # 提示詞的 token 預算；0 表示逐段翻譯
+        self.max_tokens = batch_tokens if batch_tokens > 0 else None
+        self.max_batch_size = type(self).max_batch_size if batch_tokens > 0 else 1
+        self.url = (url or self.url).rstrip('/')
+        self.generate_url = f'{self.url}/api/generate'
+        # 伺服器若以 OLLAMA_NUM_PARALLEL 調高並行數，用戶端跟著放寬
+        self.max_concurrency = parallel or int(os.environ.get('OLLAMA_NUM_PARALLEL') or 0) or self.max_concurrency
+        # 保持連線的共用 Session：只連一台主機；重試與降速交給 RateLimiter
+        # 批次模式下多份文件共用本引擎，連線池須容納所有文件的並行請求
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(16, self.max_concurrency), max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._async_client = None
+        self._streams = {}  # 進行中的串流請求：鍵 -> (should_stop, 中止函式)
+        self._streams_lock = threading.Lock()
+
+    def list_models(self):
+        """返回 Ollama 上可用的模型名稱"""
+        response = self.session.get(f'{self.url}/api/tags', timeout=5)
+        if response.status_code != 200:
+            raise EngineUnavailable("Ollama not responding", "Please make sure Ollama is running (ollama serve)")
+        return [model.get('name', '') for model in response.json().get('models', []) if model.get('name')]
+
+    def setup(self):
+        import requests
+        try:
+            models = self.list_models()
+        except requests.RequestException as e:
+            raise EngineUnavailable(f"Cannot connect to Ollama: {e}",
+                                    "Please make sure Ollama is running (ollama serve)")
+        if not models:
+            raise EngineUnavailable("No Ollama models found", "Please download a model: ollama pull gemma2:9b")
+        if self.model is None:
+            # 優先選擇 gemma 系列模型，沒有時使用第一個可用模型
+            self.model = next((name for name in models if 'gemma' in name.lower()), models[0])
+        elif self.model not in models:
+            raise EngineUnavailable(f"Ollama model not found: {self.model}",
+                                    f"Available models: {', '.join(models)}")
+
+    def _payload(self, prompt, max_tokens):
+        # num_predict 讓伺服器端在失控的生成超出上限時自行停止
+        return {'model': self.model, 'prompt': prompt, 'stream': True,
+                'options': dict(self.GENERATE_OPTIONS, num_predict=max_tokens)}
+
+    def _check_status(self, response, metrics):
+        """依狀態碼調整速率；非 200 時記錄錯誤並返回 False"""
+        self.limiter.on_response(response.status_code)
+        if response.status_code != 200:
+            metrics.count('request_errors')
+            self.log(f"   [WARNING] Ollama translation failed: {response.status_code}")
+            return False
+        return True
+
+    def _finish_stream(self, stream, metrics, histogram):
+        """記錄串流請求的耗時與生成指標，返回 stream"""
+        metrics.observe(histogram, time.perf_counter() - stream.started)
+        stream.record(metrics)
+        if stream.cut_off:
+            self.log(f"   [WARNING] Ollama output exceeded {stream.max_tokens} tokens, stopped early")
+        return stream
+
+    def _request_failed(self, error, metrics):
+        self.limiter.on_failure()
+        metrics.count('request_errors')
+        self.log(f"   [WARNING] Ollama translation error: {error}")
+
+    @contextmanager
+    def _track(self, should_stop, abort):
+        """登記進行中的請求，讓 abort_requests 能在取消時中止它"""
+        if should_stop is None:
+            yield
+            return
+        key = object()
+        with self._streams_lock:
+            self._streams[key] = (should_stop, abort)
+        try:
+            # 登記前就已取消的工作不會被 abort_requests 看到，這裡補上檢查
+            if should_stop():
+                abort()
+            yield
+        finally:
+            with self._streams_lock:
+                del self._streams[key]
+
+    def abort_requests(self):
+        with self._streams_lock:
+            aborts = [abort for should_stop, abort in self._streams.values() if should_stop()]
+        for abort in aborts:
+            abort()
+
+    @staticmethod
+    def _shutdown(response):
+        """關閉串流回應底層的 socket；阻塞在讀取中的執行緒會立即收到例外"""
+        import socket
+        sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _generate(self, prompt, timeout, metrics, histogram, max_tokens, should_stop=None):
+        """送出一個串流生成請求並逐段讀取，返回 GenerationStream；失敗時返回 None，取消時拋出 TranslationCancelled"""
+        self.limiter.acquire()
+        metrics.count('requests')
+        stream = GenerationStream(max_tokens)
+        try:
+            # timeout 為兩段輸出之間的最長等待，正常生成中的長回應不會被切斷
+            with self.session.post(self.generate_url, json=self._payload(prompt, max_tokens), stream=True,
+                                   timeout=(5, timeout)) as response:
+                if not self._check_status(response, metrics):
+                    return None
+                with self._track(should_stop, lambda: self._shutdown(response)):
+                    for data in response.iter_content(chunk_size=None):
+                        if (should_stop and should_stop()) or not stream.feed_data(data):
+                            break
+        except Exception as e:
+            if should_stop and should_stop():
+                metrics.count('cancelled_requests')
+                raise TranslationCancelled('cancelled')
+            self._request_failed(e, metrics)
+            return None
+        if should_stop and should_stop():
+            metrics.count('cancelled_requests')
+            raise TranslationCancelled('cancelled')
+        return self._finish_stream(stream, metrics, histogram)
+
+    def _get_async_client(self):
+        """在事件迴圈中建立（一次）httpx 非同步用戶端，連線數與並行上限相同"""
+        if self._async_client is None:
+            import httpx
+            if hasattr(httpx, 'Limits'):
+                limits = {'limits': httpx.Limits(max_connections=self.max_concurrency,
+                                                 max_keepalive_connections=self.max_concurrency)}
+            else:  # httpx < 0.18（googletrans 3.1.0a0 安裝的版本）
+                limits = {'pool_limits': httpx.PoolLimits(max_keepalive=self.max_concurrency,
+                                                          max_connections=self.max_concurrency)}
+            self._async_client = httpx.AsyncClient(**limits)
+        return self._async_client
+
+    async def _generate_async(self, prompt, timeout, metrics, histogram, max_tokens, should_stop=None):
+        """_generate 的 asyncio 版本；取消時由 abort_requests 取消執行中的協程"""
+        import asyncio
+        await self.limiter.acquire_async()
+        metrics.count('requests')
+        stream = GenerationStream(max_tokens)
+        task = asyncio.current_task()
+        try:
+            with self._track(should_stop, lambda: self._loop.call_soon_threadsafe(task.cancel)):
+                async with self._get_async_client().stream('POST', self.generate_url,
+                                                           json=self._payload(prompt, max_tokens),
+                                                           timeout=timeout) as response:
+                    if not self._check_status(response, metrics):
+                        return None
+                    # 不用 aiter_lines：舊版 httpx 會把整個回應讀完才切行
+                    async for data in response.aiter_bytes():
+                        if (should_stop and should_stop()) or not stream.feed_data(data):
+                            break
+        except (Exception, asyncio.CancelledError) as e:
+            if should_stop and should_stop():
+                metrics.count('cancelled_requests')
+                raise TranslationCancelled('cancelled')
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._request_failed(e, metrics)
+            return None
+        if should_stop and should_stop():
+            metrics.count('cancelled_requests')
+            raise TranslationCancelled('cancelled')
+        return self._finish_stream(stream, metrics, histogram)
+
+    @staticmethod
+    def _output_budget(texts):
+        """依原文估計合理的輸出 token 上限；超出代表模型失控（重複、開始解釋等）"""
+        return 4 * sum(estimate_tokens(text) for text in texts) + 8 * len(texts) + 32
+
+    def _single_prompt(self, text, target_lang):
+        target_lang_name = LANG_NAMES.get(target_lang, target_lang)
+        return f"""You are a professional translator. Translate the following text to {target_lang_name}.
+Rules:
+- Only provide the translation
+- Do not include any explanations, notes, or the original text
+- Maintain the original meaning and tone
+- Keep proper nouns and technical terms appropriate
+
+Text to translate:
+{text}
+
+Translation:"""
+
+    @staticmethod
+    def _single_result(text, stream):
+        # 提前停止的輸出不完整，視為失敗
+        if stream is None or stream.cut_off:
+            return text
+        # 清理可能的多餘內容
+        translated = clean_llm_output(stream.text)
+        return translated if translated and translated != text else text
+
+    def _batch_results(self, texts, stream, metrics):
+        """解析批次回應，無法對齊的段落為 None"""
+        if stream is None:
+            return [None] * len(texts)
+        translations = parse_numbered_response(stream.text, len(texts))
+        if stream.cut_off:
+            # 提前停止時最後一個收到的段落正是失控的那一段，改為逐段重譯
+            last = max((i for i, translated in enumerate(translations) if translated is not None), default=None)
+            if last is not None:
+                translations[last] = None
+        missing = sum(1 for translated in translations if translated is None)
+        if missing:
+            metrics.count('retries', missing)
+            self.log(f"   [WARNING] {missing}/{len(texts)} batch lines misaligned, retrying individually")
+        return translations
+
+    def _translate_one(self, text, target_lang, metrics, should_stop):
+        stream = self._generate(self._single_prompt(text, target_lang), 30, metrics, 'request_seconds',
+                                self._output_budget([text]), should_stop)
+        return self._single_result(text, stream)
+
+    def translate_batch(self, texts, target_lang, metrics=None, should_stop=None):
+        metrics = metrics or self.metrics
+        if len(texts) == 1:
+            return [self._translate_one(texts[0], target_lang, metrics, should_stop)]
+
+        prompt = build_batch_prompt(texts, LANG_NAMES.get(target_lang, target_lang))
+        stream = self._generate(prompt, 30, metrics, 'batch_request_seconds', self._output_budget(texts), should_stop)
+        translations = self._batch_results(texts, stream, metrics)
+        for i, translated in enumerate(translations):
+            if translated is None:
+                translations[i] = self._translate_one(texts[i], target_lang, metrics, should_stop)
+        return translations
+
+    async def _translate_one_async(self, text, target_lang, metrics, should_stop):
+        stream = await self._generate_async(self._single_prompt(text, target_lang), 30, metrics, 'request_seconds',
+                                            self._output_budget([text]), should_stop)
+        return self._single_result(text, stream)
+
+    async def translate_batch_async(self, texts, target_lang, metrics=None, should_stop=None):
+        import asyncio
+        metrics = metrics or self.metrics
+        if len(texts) == 1:
+            return [await self._translate_one_async(texts[0], target_lang, metrics, should_stop)]
+
+        prompt = build_batch_prompt(texts, LANG_NAMES.get(target_lang, target_lang))
+        stream = await self._generate_async(prompt, 30, metrics, 'batch_request_seconds', self._output_budget(texts),
+                                            should_stop)
+        translations = self._batch_results(texts, stream, metrics)
+        missing = [i for i, translated in enumerate(translations) if translated is None]
+        # 無法對齊的段落同時重送，總量仍受連線數與限速器約束
+        retried = await asyncio.gather(*(self._translate_one_async(texts[i], target_lang, metrics, should_stop)
+                                         for i in missing))
+        for i, translated in zip(missing, retried):
+            translations[i] = translated
+        return translations
+
+
+@register_engine
+class MockEngine(TranslationEngine):
+    """離線模擬引擎：不連網，依原文雜湊產生可重現的假譯文，每個請求等待 latency 秒；供測試與基準測試使用"""
+
+    name = 'mock'
+    max_batch_size = 100
+    max_chars = 20000
+    default_rate = (1000.0, 100000.0)
+    CJK_CHARS = '這是翻譯後的中文內容包含產品說明與技術規格請參考下列表格資料數值單位電源輸入輸出安全警告'
+
+    def __init__(self, latency=0.0, batch_size=None, **options):
+        super().__init__(**options)
+        self.latency = latency
+        if batch_size:
+            self.max_batch_size = batch_size
+
+    def fake_translation(self, text, target_lang):
+        """依原文雜湊挑選中文字，長度約為原文的一半"""
+        seed = zlib.crc32(f"{target_lang}:{text}".encode('utf-8'))
+        length = max(2, len(text) // 2)
+        return ''.join(self.CJK_CHARS[(seed + i * 7919) % len(self.CJK_CHARS)] for i in range(length))
+
+    def translate_batch(self, texts, target_lang, metrics=None, should_stop=None):
+        metrics = metrics or self.metrics
+        self.limiter.acquire()
+        metrics.count('requests')
+        started = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        self.limiter.on_success()
+        metrics.observe('request_seconds' if len(texts) == 1 else 'batch_request_seconds',
+                        time.perf_counter() - started)
+        return [self.fake_translation(text, target_lang) for text in texts]
+
+
+def normalize_text(text):
+    """正規化原文：合併連續空白並去除首尾空白"""
+    return ' '.join(text.split())
+
+
+def deduplicate_texts(texts):
+    """合併重複原文，返回 (唯一原文列表, 每段原文對應的唯一索引)"""
+    index_of = {}
+    unique = []
+    mapping = []
+    for text in texts:
+        key = normalize_text(text)
+        idx = index_of.get(key)
+        if idx is None:
+            idx = index_of[key] = len(unique)
+            unique.append(text)
+        mapping.append(idx)
+    return unique, mapping
+
+
+SEGMENT_MODES = ('span', 'line', 'block')
+
+
+@lru_cache(maxsize=None)
+def text_extract_flags():
+    """只提取文字：去掉 "dict" 預設旗標中的 TEXT_PRESERVE_IMAGES，避免解碼並複製整頁圖片資料"""
+    return fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+@lru_cache(maxsize=1024)
+def color_to_rgb(color):
+    """將 PyMuPDF 的 sRGB 整數顏色轉為 0~1 的 (r, g, b)"""
+    if not color:
+        return (0, 0, 0)
+    return (((color >> 16) & 0xFF) / 255.0, ((color >> 8) & 0xFF) / 255.0, (color & 0xFF) / 255.0)
+
+
+class SpanTable:
+    """單頁翻譯單元的欄位式儲存：座標、字級、顏色存於 array，原文以 sys.intern 共用字串"""
+
+    __slots__ = ('page_num', 'x0', 'y0', 'x1', 'y1', 'size', 'color', 'lines', 'text', 'translated',
+                 'rx0', 'ry0', 'rx1', 'ry1')
+
+    def __init__(self, page_num):
+        self.page_num = page_num
+        self.x0 = array('f')
+        self.y0 = array('f')
+        self.x1 = array('f')
+        self.y1 = array('f')
+        self.size = array('f')
+        self.color = array('I')
+        self.lines = array('H')
+        self.text = []
+        self.translated = None
+        # 需要覆蓋的原文矩形；合併的翻譯單元會有多個
+        self.rx0 = array('f')
+        self.ry0 = array('f')
+        self.rx1 = array('f')
+        self.ry1 = array('f')
+
+    def __len__(self):
+        return len(self.text)
+
+    def append(self, text, bbox, size, color, lines=1, span_bboxes=None):
+        """加入一個翻譯單元"""
+        self.x0.append(bbox[0])
+        self.y0.append(bbox[1])
+        self.x1.append(bbox[2])
+        self.y1.append(bbox[3])
+        self.size.append(size)
+        self.color.append(color or 0)
+        self.lines.append(lines)
+        self.text.append(sys.intern(text))
+        for rect in span_bboxes or (bbox,):
+            self.rx0.append(rect[0])
+            self.ry0.append(rect[1])
+            self.rx1.append(rect[2])
+            self.ry1.append(rect[3])
+
+    def bbox(self, i):
+        return (self.x0[i], self.y0[i], self.x1[i], self.y1[i])
+
+    def redact_rects(self):
+        """返回所有需要覆蓋的原文矩形"""
+        return zip(self.rx0, self.ry0, self.rx1, self.ry1)
+
+    def text_colors(self):
+        """整欄計算插入譯文用的 RGB 顏色"""
+        return [color_to_rgb(color) for color in self.color]
+
+    def to_dict(self):
+        """轉為可寫入 JSON 的欄位字典"""
+        return {
+            'page_num': self.page_num,
+            'columns': {name: list(getattr(self, name)) for name in
+                        ('x0', 'y0', 'x1', 'y1', 'size', 'color', 'lines', 'rx0', 'ry0', 'rx1', 'ry1')},
+            'text': self.text
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        table = cls(data['page_num'])
+        for name, values in data['columns'].items():
+            getattr(table, name).extend(values)
+        table.text = [sys.intern(text) for text in data['text']]
+        return table
+
+
+def extract_page_spans(page, page_num, segment='span'):
+    """提取單頁的翻譯單元為 SpanTable；segment 為 span（逐段）、line（合併同一行）或 block（合併同一區塊）"""
+    table = SpanTable(page_num)
+    for block in page.get_text("dict", flags=text_extract_flags())["blocks"]:
+        if block["type"] != 0:
+            continue
+        
+        block_spans = []
+        block_lines = []
+        for line in block["lines"]:
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            
+            if segment == 'span':
+                for span in spans:
+                    if len(span["text"].strip()) > 1:
+                        table.append(span["text"], span["bbox"], span["size"], span.get("color", 0))
+            elif segment == 'line':
+                line_text = ''.join(span["text"] for span in spans).strip()
+                if len(line_text) > 1:
+                    _append_merged(table, spans, line_text, 1)
+            else:
+                block_spans.extend(spans)
+                block_lines.append(''.join(span["text"] for span in spans).strip())
+        
+        if segment == 'block' and block_spans:
+            block_text = ' '.join(block_lines)
+            if len(block_text) > 1:
+                _append_merged(table, block_spans, block_text, len(block_lines))
+    return table
+
+
+def _append_merged(table, spans, text, lines):
+    """將多個 span 合併為一個翻譯單元，保留各 span 的 bbox 供覆蓋原文"""
+    bboxes = [span["bbox"] for span in spans]
+    union = (
+        min(bbox[0] for bbox in bboxes),
+        min(bbox[1] for bbox in bboxes),
+        max(bbox[2] for bbox in bboxes),
+        max(bbox[3] for bbox in bboxes)
+    )
+    table.append(text, union, spans[0]["size"], spans[0].get("color", 0), lines, bboxes)
+
+
+def _extract_shard(pdf_path, page_nums, segment):
+    """在子行程中以獨立的文件控制代碼提取一組頁面，返回 [(頁碼, 文字區塊), ...]"""
+    doc = fitz.open(pdf_path)
+    try:
+        return [(page_num, extract_page_spans(doc[page_num], page_num, segment)) for page_num in page_nums]
+    finally:
+        doc.close()
+
+
+def split_shards(page_nums, workers, shards_per_worker=4):
+    """將頁碼切成連續的分片；分片數多於工作行程以平衡各頁成本差異"""
+    page_nums = list(page_nums)
+    count = min(len(page_nums), workers * shards_per_worker) or 1
+    size = -(-len(page_nums) // count)
+    return [page_nums[i:i + size] for i in range(0, len(page_nums), size)]
+
+
+def extract_pages_parallel(pdf_path, page_nums, workers, on_progress=None, segment='span'):
+    """以多行程平行提取頁面文字，依頁碼順序返回 [(頁碼, 文字區塊), ...]"""
+    # 匯入 ProcessPoolExecutor 會載入 multiprocessing，只在真正平行處理時才付出這個成本
+    from concurrent.futures import ProcessPoolExecutor
+    
+    shards = split_shards(page_nums, workers)
+    results = [None] * len(shards)
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+        futures = {executor.submit(_extract_shard, pdf_path, shard, segment): i for i, shard in enumerate(shards)}
+        done_pages = 0
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            done_pages += len(results[futures[future]])
+            if on_progress:
+                on_progress(done_pages, len(page_nums))
+    return [page for shard in results for page in shard]
+
+
+# 依序嘗試的內建 CJK 字型
+FONT_CANDIDATES = ('china-ss', 'china-s', 'cjk')
+
+
+MIN_FONT_SIZE = 6  # 縮小譯文時的最小字級（原文更小時以原文字級為準）
+
+# 斷行單位：CJK 等全形字元逐字可斷，其餘以空白分隔的字詞為單位
+_LAYOUT_TOKEN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]|\s+|[^\s\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]+')
+
+
+@lru_cache(maxsize=None)
+def load_font(fontname):
+    """載入並快取內建字型；同一行程內每個字型只解析一次"""
+    return fitz.Font(fontname)
+
+
+@lru_cache(maxsize=None)
+def load_layout(fontname):
+    """取得字型的排版器；字寬表在同一行程內跨頁、跨文件共用"""
+    return TextLayout(load_font(fontname))
+
+
+class TextLayout:
+    """以快取的字寬表直接算出譯文的字級與換行，不必反覆試插入"""
+
+    def __init__(self, font):
+        self.font = font
+        self.widths = {}  # 字元 -> 字級 1 時的寬度
+        self.ascender = font.ascender
+        self.descender = font.descender
+        self.lineheight = (self.ascender - self.descender) if self.ascender - self.descender > 1 else 1.2
+
+    def measure(self, text):
+        """將文字切成斷行單位，返回 (單位列表, 字級 1 時各單位寬度)"""
+        widths = self.widths
+        tokens = _LAYOUT_TOKEN.findall(text)
+        token_widths = []
+        for token in tokens:
+            width = 0.0
+            for char in token:
+                w = widths.get(char)
+                if w is None:
+                    w = widths[char] = self.font.glyph_advance(ord(char))
+                width += w
+            token_widths.append(width)
+        return tokens, token_widths
+
+    def wrap(self, tokens, token_widths, max_width):
+        """以字級 1 的寬度上限貪婪斷行，返回行列表；行首空白省略，過長的字詞逐字切開"""
+        lines = []
+        line = []
+        line_width = 0.0
+        for token, width in zip(tokens, token_widths):
+            if token.isspace():
+                if line:
+                    line.append(token)
+                    line_width += width
+                continue
+            if line_width + width > max_width and line:
+                lines.append(''.join(line).rstrip())
+                line = []
+                line_width = 0.0
+            if width > max_width:
+                # 單一字詞比整行還寬：逐字切成數行
+                for char in token:
+                    w = self.widths[char]
+                    if line_width + w > max_width and line:
+                        lines.append(''.join(line))
+                        line = []
+                        line_width = 0.0
+                    line.append(char)
+                    line_width += w
+                continue
+            line.append(token)
+            line_width += width
+        if line:
+            lines.append(''.join(line).rstrip())
+        return lines
+
+    def fit(self, text, width, height, size, min_size=MIN_FONT_SIZE):
+        """算出譯文放進 width x height 的字級與各行文字，返回 (字級, 行列表)
+
+        先試單行縮小；區塊夠高時再以面積估算換行後的字級，斷行一次，
+        行數超出高度時依比例縮小再斷一次（縮小後行數不會增加），不做反覆嘗試。
+        """
+        min_size = min(size, min_size)
+        tokens, token_widths = self.measure(text)
+        total = sum(token_widths)
+        if total * size <= width or width <= 0:
+            return size, [text]
+        
+        single = max(width / total, min_size)
+        lineheight = self.lineheight
+        if height < 2 * lineheight * single:
+            # 高度放不下兩行：只縮小字級
+            return single, [text]
+        
+        fitted = min(size, (width * height / (total * lineheight)) ** 0.5)
+        lines = self.wrap(tokens, token_widths, width / fitted)
+        if len(lines) * lineheight * fitted > height:
+            fitted = height / (len(lines) * lineheight)
+            lines = self.wrap(tokens, token_widths, width / fitted)
+        if fitted <= single:
+            return single, [text]
+        return max(fitted, min_size), lines
+
+
+class FontManager:
+    """一次解析好文件要用的字型，並統計插入失敗次數"""
+
+    def __init__(self, fontnames=FONT_CANDIDATES):
+        self.fontnames = tuple(fontnames)
+        self.font = None
+        for fontname in self.fontnames:
+            try:
+                self.font = load_font(fontname)
+                self.fontname = fontname
+                break
+            except Exception:
+                continue
+        if self.font is None:
+            raise RuntimeError(f"No usable font among: {', '.join(self.fontnames)}")
+        self.layout = load_layout(self.fontname)
+        self.failures = 0
+        self.last_error = None
+
+    def record_failure(self, error):
+        self.failures += 1
+        self.last_error = error
+
+
+# 覆蓋原文的方式：text 只移除文字、不動圖片與線條；fill 以白底蓋掉整個矩形（舊行為）
+REDACT_MODES = ('text', 'fill')
+
+
+def _merge_pass(rects, mergeable):
+    """依序把可合併的矩形併入前一個，返回合併後的列表"""
+    merged = []
+    for rect in rects:
+        if merged and mergeable(merged[-1], rect):
+            last = merged[-1]
+            merged[-1] = (min(last[0], rect[0]), min(last[1], rect[1]), max(last[2], rect[2]), max(last[3], rect[3]))
+        else:
+            merged.append(rect)
+    return merged
+
+
+def plan_redactions(rects, tolerance=1.0):
+    """將重疊或相鄰的覆蓋矩形合併成較少的矩形；只合併聯集不會多蓋到其他內容的組合"""
+    def same_row(a, b):
+        # 上下邊界都對齊，且水平方向重疊或間距不超過容差；高度不同的矩形（例如大字旁的小字）
+        # 聯集會蓋到兩者之外的區域，那裡可能有提取時略過的上標或註腳符號，因此不合併
+        return (abs(a[1] - b[1]) <= tolerance and abs(a[3] - b[3]) <= tolerance
+                and b[0] <= a[2] + tolerance and a[0] <= b[2] + tolerance)
+    
+    def same_column(a, b):
+        # 左右邊界都對齊（例如左右對齊的段落），且上下重疊或間距不超過容差
+        return (abs(a[0] - b[0]) <= tolerance and abs(a[2] - b[2]) <= tolerance
+                and b[1] <= a[3] + tolerance and a[1] <= b[3] + tolerance)
+    
+    rows = _merge_pass(sorted(rects, key=lambda r: (r[1], r[0])), same_row)
+    return _merge_pass(sorted(rows, key=lambda r: (r[0], r[1])), same_column)
+
+
+def redact_page(page, rects, mode='text'):
+    """以合併後的矩形移除頁面原文，返回實際加入的覆蓋區數"""
+    planned = plan_redactions(rects)
+    fill = (1, 1, 1) if mode == 'fill' else False
+    for rect in planned:
+        page.add_redact_annot(fitz.Rect(rect), fill=fill)
+    if mode == 'fill':
+        page.apply_redactions()
+    else:
+        # 只移除文字；圖片與向量圖形原封不動，也不必逐一檢查每個矩形下的圖片
+        page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+    return len(planned)
+
+
+def apply_page_translations(page, table, fonts=None, redact='text', metrics=None):
+    """覆蓋單頁原文並插入 SpanTable 中的翻譯，返回成功插入數；失敗次數記在 fonts.failures，
+    有 metrics 時分別累計 redact 與 insert 的耗時"""
+    fonts = fonts or FontManager()
+    font = fonts.font
+    layout = fonts.layout
+    success = 0
+    started = time.perf_counter()
+    
+    # 移除原文（合併的翻譯單元覆蓋原本各 span 的位置，相鄰矩形先合併）
+    redact_page(page, list(table.redact_rects()), redact)
+    if metrics:
+        redacted = time.perf_counter()
+        metrics.add_time('redact', redacted - started)
+        started = redacted
+    
+    # 插入翻譯；字級與換行由 TextLayout 依原文範圍算好，同色文字收進同一個 TextWriter 一次寫入
+    colors = table.text_colors()
+    writers = {}
+    for i, translated in enumerate(table.translated):
+        text_color = colors[i]
+        writer = writers.get(text_color)
+        if writer is None:
+            writer = writers[text_color] = fitz.TextWriter(page.rect, color=text_color)
+        
+        try:
+            x0, y0, x1, y1 = table.bbox(i)
+            size, lines = layout.fit(translated, x1 - x0, y1 - y0, table.size[i])
+            if len(lines) == 1:
+                # 單行：與原文底部對齊，縮小後仍落在原本的基線附近
+                writer.append((x0, y1 + layout.descender * size), lines[0], font=font, fontsize=size)
+            else:
+                baseline = y0 + layout.ascender * size
+                for line in lines:
+                    writer.append((x0, baseline), line, font=font, fontsize=size)
+                    baseline += layout.lineheight * size
+            success += 1
+        except Exception as e:
+            fonts.record_failure(e)
+    
+    for writer in writers.values():
+        writer.write_text(page)
+    if metrics:
+        metrics.add_time('insert', time.perf_counter() - started)
+    return success
+
+
+def subset_fonts(doc):
+    """只保留實際用到的字形"""
+    try:
+        doc.subset_fonts()
+    except Exception:
+        # MuPDF 的子集化失敗時保留完整字型，輸出仍然正確
+        pass
+
+
+def _xrefs_in(doc, kind, value):
+    """xref_get_key 取得的值所引用的物件編號；值為陣列或指向陣列的引用時返回陣列中的每一項"""
+    if kind == 'xref':
+        xref = int(value.split()[0])
+        value = doc.xref_object(xref, compressed=True)
+        if not value.startswith('['):
+            return [xref]
+    elif kind != 'array':
+        return []
+    return [int(xref) for xref in re.findall(r'(\d+) \d+ R', value)]
+
+
+def dedupe_font_streams(doc):
+    """讓內容相同的字型檔與 ToUnicode 資料流共用同一個物件，返回改指向的引用數"""
+    kept = {}
+    merged = 0
+    
+    def share(xref, key):
+        nonlocal merged
+        kind, value = doc.xref_get_key(xref, key)
+        if kind != 'xref':
+            return
+        stream_xref = int(value.split()[0])
+        digest = hashlib.sha256(doc.xref_stream_raw(stream_xref) or b'')
+        digest.update(doc.xref_object(stream_xref, compressed=True).encode('utf-8'))
+        keep = kept.setdefault((key, digest.digest()), stream_xref)
+        if keep != stream_xref:
+            # 原本的資料流不再被引用，存檔時由 garbage 清除
+            doc.xref_set_key(xref, key, f'{keep} 0 R')
+            merged += 1
+    
+    font_xrefs = {font[0] for page_num in range(doc.page_count) for font in doc.get_page_fonts(page_num)}
+    for font_xref in sorted(font_xrefs):
+        share(font_xref, 'ToUnicode')
+        # Type0 字型的字型檔在子字型的 FontDescriptor 中，簡單字型則直接在自己的 FontDescriptor 中
+        fonts = [font_xref] + _xrefs_in(doc, *doc.xref_get_key(font_xref, 'DescendantFonts'))
+        for xref in fonts:
+            for descriptor in _xrefs_in(doc, *doc.xref_get_key(xref, 'FontDescriptor')):
+                for key in ('FontFile', 'FontFile2', 'FontFile3'):
+                    share(descriptor, key)
+    return merged
+
+
+def write_output(doc, output_path, garbage=3, deflate=True):
+    """將文件一次完整寫出並關閉"""
+    # 先寫入同目錄的暫存檔再替換，中途失敗不會留下半個輸出檔；輸出與輸入相同路徑時也能覆寫
+    tmp_path = output_path + '.tmp'
+    try:
+        # 合併的分片各自嵌入同一個字型，去重後只產生一份子集
+        dedupe_font_streams(doc)
+        subset_fonts(doc)
+        doc.save(
+            tmp_path,
+            garbage=garbage,
+            deflate=deflate,
+            deflate_images=deflate,
+            deflate_fonts=deflate
+        )
+        doc.close()
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if not doc.is_closed:
+            doc.close()
+        # 寫到一半的暫存檔不能留在輸出目錄
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _apply_shard(pdf_path, shard, shard_path, fontnames, redact):
+    """在子行程中套用一組頁面的翻譯並另存為分片檔，返回 (成功數, 失敗數, {頁碼: 連結列表})"""
+    doc = fitz.open(pdf_path)
+    try:
+        fonts = FontManager(fontnames)
+        success = 0
+        links = {}
+        for page_num, page_texts in shard:
+            page = doc[page_num]
+            success += apply_page_translations(page, page_texts, fonts, redact)
+            links[page_num] = page.get_links()
+        doc.select([page_num for page_num, _ in shard])
+        # select 不會刪除其他頁面的物件，不做垃圾回收時每個分片都是整份輸入的副本
+        doc.save(shard_path, garbage=1)
+        return success, fonts.failures, links
+    finally:
+        doc.close()
+
+
+def _merge_shards(pdf_path, output_path, shards, shard_paths, shard_links, save_options):
+    """依原始頁序合併分片檔與未翻譯頁面，並還原連結、書籤、頁碼標籤與中繼資料，返回 (無法還原的連結數, 最後的錯誤)"""
+    location = {}  # 頁碼 -> (分片索引, 分片內索引)
+    for i, shard in enumerate(shards):
+        for j, (page_num, _) in enumerate(shard):
+            location[page_num] = (i, j)
+    
+    src = fitz.open(pdf_path)
+    shard_docs = [fitz.open(path) for path in shard_paths]
+    out = fitz.open()
+    try:
+        # 來源相同且連續的頁面一次插入
+        page_num = 0
+        while page_num < len(src):
+            run = 1
+            if page_num in location:
+                i, j = location[page_num]
+                while location.get(page_num + run) == (i, j + run):
+                    run += 1
+                out.insert_pdf(shard_docs[i], from_page=j, to_page=j + run - 1, links=False)
+            else:
+                while page_num + run < len(src) and page_num + run not in location:
+                    run += 1
+                out.insert_pdf(src, from_page=page_num, to_page=page_num + run - 1, links=False)
+            page_num += run
+        
+        # 頁數與頁序與原文件相同，頁碼型連結可直接還原
+        link_failures = 0
+        last_error = None
+        for page_num in range(len(src)):
+            page_links = shard_links.get(page_num)
+            if page_links is None:
+                page_links = src[page_num].get_links()
+            page = out[page_num]
+            for link in page_links:
+                try:
+                    page.insert_link(link)
+                except Exception as e:
+                    link_failures += 1
+                    last_error = e
+        
+        out.set_toc(src.get_toc(simple=False))
+        out.set_metadata(src.metadata)
+        labels = src.get_page_labels()
+        if labels:
+            out.set_page_labels(labels)
+        write_output(out, output_path, **save_options)
+        return link_failures, last_error
+    finally:
+        if not out.is_closed:
+            out.close()
+        for shard_doc in shard_docs:
+            shard_doc.close()
+        src.close()
+
+
+def apply_pages_parallel(pdf_path, output_path, pages_data, workers, on_progress=None, save_options=None,
+                         fontnames=FONT_CANDIDATES, redact='text'):
+    """以多行程平行套用翻譯到各自的文件副本，再依頁序合併為輸出檔，
+    返回 (成功數, 失敗數, 無法還原的連結數, 最後的連結錯誤)"""
+    from concurrent.futures import ProcessPoolExecutor
+    
+    shards = split_shards(pages_data, workers)
+    tmp_dir = tempfile.mkdtemp(prefix='pdf-translator-')
+    try:
+        shard_paths = [os.path.join(tmp_dir, f'shard-{i:04d}.pdf') for i in range(len(shards))]
+        success = 0
+        failures = 0
+        shard_links = {}
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as executor:
+            futures = {
+                executor.submit(_apply_shard, pdf_path, shard, path, fontnames, redact): shard
+                for shard, path in zip(shards, shard_paths)
+            }
+            done_pages = 0
+            for future in as_completed(futures):
+                shard_success, shard_failures, links = future.result()
+                success += shard_success
+                failures += shard_failures
+                shard_links.update(links)
+                done_pages += len(futures[future])
+                if on_progress:
+                    on_progress(done_pages, len(pages_data))
+        
+        link_failures, link_error = _merge_shards(pdf_path, output_path, shards, shard_paths, shard_links,
+                                                  save_options or {})
+        return success, failures, link_failures, link_error
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def default_cache_dir():
+    """返回翻譯記憶的預設存放目錄"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pdf-translator')
+
+
+class TranslationMemory:
+    """以 SQLite 保存的持久翻譯記憶，鍵為 (引擎, 模型, 目標語言, 正規化原文雜湊)"""
+
+    def __init__(self, cache_dir=None, max_entries=200000, max_age_days=180):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._dirty = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, 'translation_memory.sqlite3')
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS memory (
+                key TEXT PRIMARY KEY,
+                engine TEXT NOT NULL,
+                model TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                source TEXT NOT NULL,
+                translated TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS memory_last_used ON memory(last_used)')
+        self._conn.commit()
+
+    def _key(self, engine, model, target_lang, text):
+        raw = '\0'.join((engine, model or '', target_lang, normalize_text(text)))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, engine, model, target_lang, text):
+        """查詢翻譯記憶，未命中時返回 None"""
+        key = self._key(engine, model, target_lang, text)
+        with self._lock:
+            row = self._conn.execute('SELECT translated FROM memory WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute('UPDATE memory SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._commit_periodically()
+            return row[0]
+
+    def put(self, engine, model, target_lang, text, translated):
+        """寫入一筆翻譯"""
+        key = self._key(engine, model, target_lang, text)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, engine, model or '', target_lang, normalize_text(text), translated, now, now)
+            )
+            self._commit_periodically()
+
+    def _commit_periodically(self):
+        # 呼叫端須持有 self._lock；每累積一批寫入才提交，避免每筆都同步到磁碟
+        self._dirty += 1
+        if self._dirty >= 100:
+            self._conn.commit()
+            self._dirty = 0
+
+    def evict(self):
+        """依存放時間與最近使用時間淘汰舊資料，返回刪除筆數"""
+        with self._lock:
+            removed = self._conn.execute(
+                'DELETE FROM memory WHERE created < ?', (time.time() - self.max_age,)
+            ).rowcount
+            count = self._conn.execute('SELECT COUNT(*) FROM memory').fetchone()[0]
+            if count > self.max_entries:
+                removed += self._conn.execute(
+                    'DELETE FROM memory WHERE key IN '
+                    '(SELECT key FROM memory ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,)
+                ).rowcount
+            self._conn.commit()
+            self._dirty = 0
+            return removed
+
+    def close(self):
+        """淘汰過期資料並關閉資料庫"""
+        self.evict()
+        with self._lock:
+            self._conn.close()
+
+
+class TranslationCheckpoint:
+    """日誌式檢查點：逐行記錄提取結果與已完成的翻譯，供中斷後以 --resume 續傳"""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.pages_data = None
+        self.translations = {}
+        self.resumed = False
+        self._file = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()  # 串流模式下多頁同時記錄翻譯
+
+    def load(self):
+        """載入既有檢查點；文件不存在或與目前工作不符時返回 False"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            lines = f.readlines()
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # 中斷時寫到一半的最後一行
+                continue
+        if not records or records[0].get('type') != 'header' or records[0].get('fingerprint') != self.fingerprint:
+            return False
+        
+        for record in records[1:]:
+            if record['type'] == 'pages':
+                self.pages_data = [(data['page_num'], SpanTable.from_dict(data)) for data in record['pages']]
+            elif record['type'] == 'translation':
+                self.translations[record['text']] = record['translated']
+        
+        # 續寫同一個日誌
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self.resumed = True
+        return True
+
+    def start(self, pages_data=None):
+        """建立新的檢查點（續傳時沿用既有日誌）並寫入提取結果"""
+        if self._file is None:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._write({'type': 'header', 'fingerprint': self.fingerprint})
+        if pages_data is not None:
+            self._write({'type': 'pages', 'pages': [table.to_dict() for _, table in pages_data]})
+        self._sync()
+
+    def lookup(self, text):
+        """返回已完成的翻譯，沒有則返回 None"""
+        return self.translations.get(normalize_text(text))
+
+    def record(self, text, translated):
+        """記錄一筆完成的翻譯；翻譯失敗（返回原文）時不記錄，續傳時會重試"""
+        if translated == text:
+            return
+        key = normalize_text(text)
+        with self._lock:
+            if self._file is None:
+                return
+            self.translations[key] = translated
+            self._write({'type': 'translation', 'text': key, 'translated': translated})
+            # 每筆都寫入作業系統，程序崩潰也不會遺失；fsync 則最多每秒一次
+            self._file.flush()
+            if time.monotonic() - self._last_sync >= 1.0:
+                self._sync()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        """將緩衝寫入磁碟並關閉"""
+        with self._lock:
+            if self._file:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def remove(self):
+        """工作完成後刪除檢查點"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def collect_batch_jobs(input_dir, output_dir):
+    """掃描資料夾（含子資料夾）中的 PDF，返回 [(輸入, 輸出), ...]；輸出保留相對於 input_dir 的路徑"""
+    output_root = os.path.abspath(output_dir)
+    jobs = []
+    for root, dirs, files in os.walk(input_dir):
+        # 輸出資料夾位於輸入資料夾內時不要把譯文再翻一次
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_root)
+        for name in sorted(files):
+            if name.lower().endswith('.pdf'):
+                path = os.path.join(root, name)
+                jobs.append((path, os.path.join(output_dir, os.path.relpath(path, input_dir))))
+    return jobs
+
+
+def read_manifest(manifest_path, output_dir=None):
+    """讀取清單檔，返回 [(輸入, 輸出), ...]
+
+    每行一份文件：「輸入<Tab>輸出」；省略輸出時寫到 output_dir，或輸入旁的 *_translated.pdf。
+    相對路徑以清單檔所在資料夾為準，空行與 # 開頭的行會略過。
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.split('\t') if part.strip()]
+            input_pdf = os.path.join(base, parts[0])
+            if len(parts) > 1:
+                output_pdf = os.path.join(base, parts[1])
+            else:
+                stem, ext = os.path.splitext(os.path.basename(input_pdf))
+                output_pdf = os.path.join(output_dir or os.path.dirname(input_pdf), f"{stem}_translated{ext}")
+            jobs.append((input_pdf, output_pdf))
+    return jobs
+
+
+def is_up_to_date(input_pdf, output_pdf):
+    """輸出檔存在、比輸入新，且沒有未完成的檢查點時視為已是最新"""
+    try:
+        return (os.path.getmtime(output_pdf) >= os.path.getmtime(input_pdf)
+                and not os.path.exists(output_pdf + '.checkpoint'))
+    except OSError:
+        return False
+
+
+class TranslationCancelled(Exception):
+    """工作被取消（例如服務模式收到取消請求）"""
+
+
+class TranslationDispatcher:
+    """CLI 與 GUI 共用的翻譯流程：合併重複原文、查詢與寫入翻譯記憶，依引擎能力分組後以翻譯池送出"""
+
+    def __init__(self, translator, engine, target_lang, memory=None, metrics=None, should_stop=None):
+        self.translator = translator
+        self.engine = engine  # 翻譯記憶的鍵之一
+        self.target_lang = target_lang
+        self.memory = memory
+        self.metrics = metrics or translator.metrics
+        self.should_stop = should_stop or (lambda: False)
+
+    def _lookup(self, texts):
+        """查詢翻譯記憶，返回 (結果列表, 需要送出請求的索引)；不需翻譯或已快取的項目已填入結果"""
+        results = list(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if not text or len(text.strip()) < 2:
+                continue
+            if self.memory:
+                cached = self.memory.get(self.engine, self.translator.model, self.target_lang, text)
+                if cached is not None:
+                    self.metrics.count('cache_hits')
+                    results[i] = cached
+                    continue
+                self.metrics.count('cache_misses')
+            pending.append(i)
+        return results, pending
+
+    def _remember(self, texts, pending, translations, results):
+        """將引擎的譯文填入結果並寫入翻譯記憶"""
+        for i, translated in zip(pending, translations):
+            results[i] = translated
+            # 翻譯失敗時會返回原文，不寫入記憶
+            if self.memory and translated != texts[i]:
+                self.memory.put(self.engine, self.translator.model, self.target_lang, texts[i], translated)
+        return results
+
+    def translate_batch(self, texts):
+        """翻譯一批文本（一個引擎請求），優先查詢翻譯記憶"""
+        results, pending = self._lookup(texts)
+        if not pending:
+            return results
+        translations = self.translator.translate_batch([texts[i] for i in pending], self.target_lang, self.metrics,
+                                                       self.should_stop)
+        return self._remember(texts, pending, translations, results)
+
+    async def translate_batch_async(self, texts):
+        """translate_batch 的 asyncio 版本，在引擎的事件迴圈中執行"""
+        results, pending = self._lookup(texts)
+        if not pending:
+            return results
+        translations = await self.translator.translate_batch_async([texts[i] for i in pending], self.target_lang,
+                                                                   self.metrics, self.should_stop)
+        return self._remember(texts, pending, translations, results)
+
+    def translate_tables(self, tables, workers, on_progress=None, slots=None, async_requests=False, lookup=None,
+                         on_translated=None):
+        """翻譯各 SpanTable 的原文並寫回 translated，返回 (翻譯池, 統計)；
+        lookup(原文) 返回已有的譯文（例如檢查點）時不再送出，每完成一段呼叫 on_translated(原文, 譯文)"""
+        unique_texts, mapping = deduplicate_texts([text for table in tables for text in table.text])
+        translations = [lookup(text) if lookup else None for text in unique_texts]
+        todo = [i for i, translated in enumerate(translations) if translated is None]
+        
+        # 依引擎能力（每個請求的段數與字元／token 上限）分組，一組即一個引擎請求
+        batches = [[todo[j] for j in batch] for batch in self.translator.plan([unique_texts[i] for i in todo])]
+        
+        def on_batch(b, results):
+            for i, translated in zip(batches[b], results):
+                translations[i] = translated
+                if on_translated:
+                    on_translated(unique_texts[i], translated)
+        
+        if async_requests:
+            pool = AsyncTranslationPool(self.translate_batch_async, self.translator.event_loop(), workers=workers,
+                                        slots=slots)
+        else:
+            pool = TranslationPool(self.translate_batch, workers=workers, slots=slots)
+        pool.map([[unique_texts[i] for i in batch] for batch in batches], on_progress=on_progress,
+                 should_stop=self.should_stop, on_result=on_batch)
+        if self.should_stop():
+            raise TranslationCancelled('cancelled')
+        
+        offset = 0
+        for table in tables:
+            table.translated = [translations[idx] for idx in mapping[offset:offset + len(table)]]
+            offset += len(table)
+        stats = {
+            'unique': len(unique_texts),
+            'duplicates_saved': len(mapping) - len(unique_texts),
+            'resumed': len(unique_texts) - len(todo),
+            'requests': len(batches),
+            'batches': sum(1 for batch in batches if len(batch) > 1),
+        }
+        return pool, stats
 
-if sys.platform == 'win32':
-    import codecs
-    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
 
 class PDFTranslatorCLI:
-    def __init__(self, input_pdf, output_pdf, target_lang='zh-TW', pages=None, verbose=False, engine='google'):
+    def __init__(self, input_pdf, output_pdf, target_lang='zh-TW', pages=None, verbose=False, engine='google', workers=1,
+                 cache_dir=None, use_cache=True, batch_tokens=1000, batch_chars=5000, rate=None, max_rate=None,
+                 stream=False, stream_window=4, extract_workers=1, apply_workers=1,
+                 checkpoint_path=None, resume=False, segment='span', garbage=3, deflate=True,
+                 redact='text', engine_options=None, async_requests=False):
         self.input_pdf = input_pdf
         self.output_pdf = output_pdf
         self.target_lang = target_lang
         self.pages = pages
         self.verbose = verbose
-        self.engine = engine  # 'google' or 'ollama'
-        self.translator = None
-        self.ollama_model = None  # 將在 setup_translator 時自動檢測
+        self.engine = engine  # 已註冊的翻譯引擎名稱，見 ENGINES
+        self.workers = max(1, workers)  # 同時進行的翻譯請求數
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.batch_tokens = batch_tokens  # Ollama 批次提示詞的 token 預算，0 表示逐段翻譯
+        self.batch_chars = batch_chars  # Google 合併請求的字元預算，0 表示逐段翻譯
+        self.engine_options = engine_options or {}  # 傳給翻譯引擎的其他選項（例如 mock 的 latency）
+        self.async_requests = async_requests  # 以單一 asyncio 事件迴圈送出請求（引擎需支援）
+        self.memory = None  # 翻譯記憶，在 process 時開啟
+        self.limiter = RateLimiter.for_engine(engine, rate, max_rate)
+        self.stream = stream  # 串流模式：逐頁提取、翻譯、套用
+        self.stream_window = max(1, stream_window)  # 串流模式同時提取、翻譯中的頁數
+        self.extract_workers = max(1, extract_workers or os.cpu_count() or 1)  # 提取階段的行程數，0 表示全部核心
+        self.apply_workers = max(1, apply_workers or os.cpu_count() or 1)  # 套用階段的行程數，0 表示全部核心
+        self.segment = segment  # 翻譯單元：span、line 或 block
+        self.save_options = {'garbage': garbage, 'deflate': deflate}  # 輸出檔的壓縮選項
+        self.redact = redact  # 原文移除方式：text 或 fill
+        self.fonts = None  # 字型管理器，在 process 時依目標語言建立
+        # 批次模式的共用引擎沒有輸出檔，各文件的檢查點路徑由 for_document 決定
+        self.checkpoint_path = checkpoint_path or (output_pdf + '.checkpoint' if output_pdf else None)
+        self.resume = resume  # 從檢查點續傳
+        self.checkpoint = None
+        self.resumed_translations = 0  # 從檢查點取回的翻譯數
+        self.requests_saved = 0  # 去重省下的請求數
+        self.batches_sent = 0  # 含多段文本的批次請求數
+        self.stats_lock = threading.Lock()  # 串流模式下多頁同時翻譯，保護上面三個計數
+        self.translator = None  # TranslationEngine，在 setup_translator 時建立
+        self.prepared = False  # 翻譯器、字型與翻譯記憶是否已就緒
+        self.pdf_lock = threading.Lock()  # PyMuPDF 非執行緒安全；批次模式下各文件共用同一把鎖
+        self.result = None  # 最近一次 process 的摘要
+        self.progress = {'stage': 'queued', 'done': 0, 'total': 0}  # 目前階段與進度，供服務模式查詢
+        self.stop_event = threading.Event()  # 設定後盡快停止翻譯並以 TranslationCancelled 結束
+        self.metrics = RunMetrics()  # 本次執行的階段耗時、請求耗時與計數，process 開始時重設
         
     def log(self, message, force=False):
         """輸出日誌信息"""
@@ -32,306 +2068,541 @@ class PDFTranslatorCLI:
             print(message)
     
     def setup_translator(self):
-        """設置翻譯器"""
-        if self.engine == 'google':
-            try:
-                from googletrans import Translator
-                self.translator = Translator()
-                self.log("   [OK] Google Translator ready", force=True)
-                return True
-            except ImportError:
-                print("   [ERROR] googletrans not installed")
-                print("   Please run: pip install googletrans==3.1.0a0")
-                return False
-            except Exception as e:
-                print(f"   [ERROR] {e}")
-                return False
-        elif self.engine == 'ollama':
-            try:
-                import requests
-                # 獲取可用的模型列表
-                response = requests.get('http://localhost:11434/api/tags', timeout=5)
-                if response.status_code == 200:
-                    models_data = response.json()
-                    models = models_data.get('models', [])
-                    
-                    if models:
-                        # 優先選擇 gemma 系列模型
-                        self.ollama_model = None
-                        for model in models:
-                            model_name = model.get('name', '')
-                            if 'gemma' in model_name.lower():
-                                self.ollama_model = model_name
-                                break
-                        
-                        # 如果沒有 gemma 模型，使用第一個可用模型
-                        if not self.ollama_model and models:
-                            self.ollama_model = models[0].get('name', '')
-                        
-                        if self.ollama_model:
-                            self.log(f"   [OK] Ollama ready (model: {self.ollama_model})", force=True)
-                            return True
-                        else:
-                            print("   [ERROR] No Ollama models found")
-                            print("   Please download a model: ollama pull gemma2:9b")
-                            return False
-                    else:
-                        print("   [ERROR] No Ollama models found")
-                        print("   Please download a model: ollama pull gemma2:9b")
-                        return False
-                else:
-                    print("   [ERROR] Ollama not responding")
-                    return False
-            except ImportError:
-                print("   [ERROR] requests not installed")
-                print("   Please run: pip install requests")
-                return False
-            except Exception as e:
-                print(f"   [ERROR] Cannot connect to Ollama: {e}")
-                print("   Please make sure Ollama is running (ollama serve)")
-                return False
-        else:
-            print(f"   [ERROR] Unknown engine: {self.engine}")
+        """建立並連線翻譯引擎"""
+        try:
+            self.translator = create_engine(self.engine, limiter=self.limiter, log=self.log,
+                                            batch_tokens=self.batch_tokens, batch_chars=self.batch_chars,
+                                            **self.engine_options)
+            self.translator.setup()
+        except ImportError as e:
+            print(f"   [ERROR] {e.name or e} not installed")
+            print(f"   Please run: pip install {ENGINES[self.engine].requirement or e.name}")
+            return False
+        except EngineUnavailable as e:
+            print(f"   [ERROR] {e}")
+            if e.hint:
+                print(f"   {e.hint}")
+            return False
+        except Exception as e:
+            print(f"   [ERROR] {e}")
             return False
+        model = f" (model: {self.translator.model})" if self.translator.model else ""
+        self.log(f"   [OK] {self.engine} engine ready{model}", force=True)
+        if self.translator.concurrency(self.workers) < self.workers:
+            print(f"   [WARNING] {self.engine} handles at most {self.translator.max_concurrency} concurrent requests; "
+                  f"using {self.translator.concurrency(self.workers)} instead of {self.workers} workers")
+        if self.async_requests and not self.translator.supports_async:
+            print(f"   [WARNING] {self.engine} has no asyncio client; using worker threads")
+            self.async_requests = False
+        if self.async_requests and importlib.util.find_spec('httpx') is None:
+            # 非同步用戶端在請求中才匯入 httpx，缺少時每段都會靜默退回原文
+            print("   [ERROR] httpx not installed (required by --async)")
+            print("   Please run: pip install httpx")
+            return False
+        self.log(f"   Engine limits: {self.translator.capabilities()}")
+        return True
+    
+    @property
+    def model(self):
+        """翻譯引擎使用的模型（翻譯記憶與檢查點的鍵之一）"""
+        return self.translator.model if self.translator else None
     
     def translate_text(self, text):
-        """翻譯文本"""
-        if not text or len(text.strip()) < 2:
-            return text
+        """翻譯單段文本，優先查詢翻譯記憶"""
+        return self.translate_batch([text])[0]
+    
+    def dispatcher(self):
+        """以目前的引擎、目標語言、翻譯記憶與指標建立翻譯流程"""
+        return TranslationDispatcher(self.translator, self.engine, self.target_lang, self.memory, self.metrics,
+                                     self.stop_event.is_set)
+    
+    def translate_batch(self, texts):
+        """翻譯一批文本（一個引擎請求），優先查詢翻譯記憶"""
+        return self.dispatcher().translate_batch(texts)
+    
+    def prepare(self):
+        """設置翻譯器、字型與翻譯記憶；批次模式下只在共用引擎上執行一次"""
+        if not self.setup_translator():
+            return False
+        self.fonts = FontManager()
+        self.log(f"   [OK] Font: {self.fonts.fontname} ({self.fonts.font.name})")
         
-        if self.engine == 'google':
+        if self.use_cache:
             try:
-                result = self.translator.translate(text, dest=self.target_lang)
-                time.sleep(0.5)
-                return result.text
-            except Exception as e:
-                self.log(f"   [WARNING] Translation failed: {e}")
-                return text
-        elif self.engine == 'ollama':
-            return self._translate_with_ollama(text)
-        else:
-            return text
+                self.memory = TranslationMemory(self.cache_dir)
+                self.log(f"   [OK] Translation memory: {self.memory.path}", force=True)
+            except (OSError, sqlite3.Error) as e:
+                print(f"   [WARNING] Translation memory disabled: {e}")
+                self.memory = None
+        self.prepared = True
+        return True
     
-    def _translate_with_ollama(self, text):
-        """使用 Ollama 翻譯文本"""
-        try:
-            import requests
-            
-            # 根據目標語言設定提示詞
-            lang_names = {
-                'zh-TW': '繁體中文',
-                'zh-CN': '简体中文',
-                'en': 'English',
-                'ja': '日本語',
-                'ko': '한국어',
-                'fr': 'français',
-                'de': 'Deutsch',
-                'es': 'español',
-                'pt': 'português',
-                'ru': 'русский'
-            }
-            target_lang_name = lang_names.get(self.target_lang, self.target_lang)
-            
-            # 優化提示詞，使用更明確的指示
-            prompt = f"""You are a professional translator. Translate the following text to {target_lang_name}.
-Rules:
-- Only provide the translation
-- Do not include any explanations, notes, or the original text
-- Maintain the original meaning and tone
-- Keep proper nouns and technical terms appropriate
-
-Text to translate:
-{text}
-
-Translation:"""
-            
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    'model': self.ollama_model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': 0.3,  # 降低隨機性，提高準確性
-                        'top_p': 0.9
-                    }
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                translated = result.get('response', '').strip()
-                
-                # 清理可能的多餘內容
-                if translated:
-                    # 移除開頭和結尾的引號
-                    translated = translated.strip('"\'')
-                    # 如果翻譯結果包含"Translation:"等標籤，移除它
-                    if translated.lower().startswith('translation:'):
-                        translated = translated[12:].strip()
-                    # 移除可能的換行符號
-                    translated = translated.strip()
-                
-                time.sleep(0.1)  # 較短的延遲
-                return translated if translated and translated != text else text
-            else:
-                self.log(f"   [WARNING] Ollama translation failed: {response.status_code}")
-                return text
-        except Exception as e:
-            self.log(f"   [WARNING] Ollama translation error: {e}")
-            return text
+    def close(self):
+        """關閉翻譯記憶"""
+        if self.memory:
+            self.memory.close()
+            self.memory = None
+        self.prepared = False
+    
+    def for_document(self, input_pdf, output_pdf):
+        """建立共用本引擎（翻譯器、翻譯記憶、限速器、PyMuPDF 鎖）的單一文件工作"""
+        job = copy.copy(self)
+        job.input_pdf = input_pdf
+        job.output_pdf = output_pdf
+        job.checkpoint_path = output_pdf + '.checkpoint'
+        job.checkpoint = None
+        job.fonts = FontManager(self.fonts.fontnames)
+        job.resumed_translations = 0
+        job.requests_saved = 0
+        job.batches_sent = 0
+        job.stats_lock = threading.Lock()
+        job.result = None
+        job.progress = {'stage': 'queued', 'done': 0, 'total': 0}
+        job.stop_event = threading.Event()
+        job.metrics = RunMetrics()
+        return job
+    
+    def cancel(self):
+        """要求停止目前的工作；支援串流的引擎會立即中止進行中的請求，其他引擎等已送出的請求完成後結束"""
+        self.stop_event.set()
+        if self.translator:
+            self.translator.abort_requests()
+    
+    def _report_progress(self, stage, done=0, total=0):
+        self.progress = {'stage': stage, 'done': done, 'total': total}
+        if self.stop_event.is_set():
+            raise TranslationCancelled('cancelled')
     
     def process(self):
         """處理PDF"""
         print("\n" + "="*70)
         print("PDF Translation Tool - CLI Version")
         print("="*70)
+        started = time.perf_counter()
+        self.metrics = RunMetrics()
+        self.result = {
+            'input': self.input_pdf,
+            'output': self.output_pdf,
+            'status': 'failed',
+            'segments': 0,
+            'translated': 0,
+            'insertion_failures': 0,
+            'seconds': 0.0,
+            'error': None
+        }
         
         # 檢查輸入文件
         if not os.path.exists(self.input_pdf):
             print(f"\n[ERROR] Input file not found: {self.input_pdf}")
+            self.result['error'] = 'input file not found'
             return False
         
+        self.metrics.count('bytes_read', os.path.getsize(self.input_pdf))
         file_size = os.path.getsize(self.input_pdf) / (1024*1024)
         print(f"\nInput:  {self.input_pdf} ({file_size:.2f} MB)")
         print(f"Output: {self.output_pdf}")
         print(f"Target language: {self.target_lang}")
         
-        if not self.setup_translator():
+        # 批次模式的各文件共用已就緒的引擎，由批次負責關閉
+        owns_engine = not self.prepared
+        if owns_engine and not self.prepare():
+            self.result['error'] = 'translator setup failed'
             return False
         
+        self.checkpoint = TranslationCheckpoint(self.checkpoint_path, self._checkpoint_fingerprint())
+        if self.resume:
+            if self.checkpoint.load():
+                print(f"   [OK] Resuming from checkpoint: {self.checkpoint.path} "
+                      f"({len(self.checkpoint.translations)} translations done)")
+            else:
+                print(f"   [WARNING] No matching checkpoint at {self.checkpoint.path}, starting from scratch")
+        
+        completed = False
         try:
-            # 讀取PDF
-            self.log("\n[1/4] Reading PDF and extracting text...", force=True)
-            doc = fitz.open(self.input_pdf)
-            total_pages = len(doc)
-            
-            # 確定要處理的頁面範圍
-            if self.pages:
-                page_range = self._parse_page_range(self.pages, total_pages)
-                self.log(f"   Processing pages: {page_range}", force=True)
+            if self.stream:
+                if self.extract_workers > 1 or self.apply_workers > 1:
+                    print("   [WARNING] --extract-workers/--apply-workers are ignored in --stream mode")
+                success, total_texts = self._run_streaming()
             else:
-                page_range = range(total_pages)
-                self.log(f"   Processing all {total_pages} pages", force=True)
-            
-            pages_data = []
-            for page_num in page_range:
-                page = doc[page_num]
-                blocks = page.get_text("dict")["blocks"]
-                
-                texts = []
-                for block in blocks:
-                    if block["type"] == 0:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                if span["text"].strip() and len(span["text"].strip()) > 1:
-                                    texts.append({
-                                        'page_num': page_num,
-                                        'bbox': span["bbox"],
-                                        'text': span["text"],
-                                        'size': span["size"],
-                                        'color': span.get("color", 0)
-                                    })
-                pages_data.append((page_num, texts))
-                
-                if self.verbose:
-                    print(f"   Progress: {(len(pages_data))/len(page_range)*100:.1f}%", end='\r')
-            
-            total_texts = sum(len(texts) for _, texts in pages_data)
-            print(f"\n   Extracted {total_texts} text segments from {len(page_range)} pages")
-            doc.close()
-            
-            # 翻譯
-            self.log("\n[2/4] Translating text...", force=True)
-            translated_count = 0
-            for _, page_texts in pages_data:
-                for item in page_texts:
-                    item['translated'] = self.translate_text(item['text'])
-                    translated_count += 1
-                    if self.verbose or translated_count % 100 == 0:
-                        print(f"   Progress: {translated_count/total_texts*100:.1f}% ({translated_count}/{total_texts})", end='\r')
-            print(f"\n   Translation completed")
-            
-            # 創建輸出PDF
-            self.log("\n[3/4] Creating output PDF...", force=True)
-            if os.path.exists(self.output_pdf):
-                os.remove(self.output_pdf)
-            shutil.copy2(self.input_pdf, self.output_pdf)
-            
-            doc = fitz.open(self.output_pdf)
-            
-            # 應用翻譯
-            self.log("\n[4/4] Applying translations...", force=True)
-            success = 0
-            
-            for page_num, page_texts in pages_data:
-                page = doc[page_num]
-                
-                # 覆蓋原文
-                for item in page_texts:
-                    page.add_redact_annot(fitz.Rect(item['bbox']), fill=(1, 1, 1))
-                page.apply_redactions()
-                
-                # 插入翻譯
-                for item in page_texts:
-                    translated = item['translated']
-                    bbox = item['bbox']
-                    size = item['size']
-                    color = item['color']
-                    
-                    if color:
-                        r = ((color >> 16) & 0xFF) / 255.0
-                        g = ((color >> 8) & 0xFF) / 255.0
-                        b = (color & 0xFF) / 255.0
-                        text_color = (r, g, b)
-                    else:
-                        text_color = (0, 0, 0)
-                    
-                    adjusted_size = max(size * 0.7, 6)
-                    baseline_y = bbox[1] + size * 0.75
-                    
-                    # 使用內建CJK字體
-                    for fontname in ["china-ss", "china-s", "cjk"]:
-                        try:
-                            rc = page.insert_text(
-                                (bbox[0], baseline_y),
-                                translated,
-                                fontname=fontname,
-                                fontsize=adjusted_size,
-                                color=text_color
-                            )
-                            if rc > 0:
-                                success += 1
-                                break
-                        except:
-                            continue
-                
-                if self.verbose:
-                    print(f"   Progress: {(len([p for p, _ in pages_data if p <= page_num]))/len(pages_data)*100:.1f}%", end='\r')
-            
-            print(f"\n   Successfully applied {success}/{total_texts} translations")
-            
-            # 保存
-            self.log("\n   Saving PDF...", force=True)
-            doc.saveIncr()
-            doc.close()
+                success, total_texts = self._run_staged()
             
+            self.metrics.count('bytes_written', os.path.getsize(self.output_pdf))
+            self.metrics.count('segments', total_texts)
+            self.metrics.count('translated', success)
             output_size = os.path.getsize(self.output_pdf) / (1024*1024)
             
             print("\n" + "="*70)
             print("Translation completed successfully!")
             print(f"\nOutput file: {self.output_pdf} ({output_size:.2f} MB)")
             print(f"Translated: {success}/{total_texts} text segments")
+            print("Stages: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.metrics.stages.items()))
             print("="*70 + "\n")
+            self.result.update(status='ok', segments=total_texts, translated=success,
+                               insertion_failures=self.fonts.failures)
+            completed = True
             return True
             
+        except TranslationCancelled:
+            print(f"\n[CANCELLED] {self.input_pdf}")
+            self.result.update(status='cancelled', error='cancelled')
+            return False
         except Exception as e:
             print(f"\n[ERROR] {e}")
+            self.result['error'] = str(e)
             if self.verbose:
                 import traceback
                 traceback.print_exc()
             return False
+        finally:
+            self.result['seconds'] = round(time.perf_counter() - started, 2)
+            self._finish_metrics()
+            if completed:
+                self.checkpoint.remove()
+            else:
+                self.checkpoint.close()
+                if os.path.exists(self.checkpoint.path):
+                    print(f"   Checkpoint kept at {self.checkpoint.path}; rerun with --resume to continue")
+            if owns_engine:
+                self.close()
+    
+    def _finish_metrics(self):
+        """補上本次執行的計數並把指標摘要放進 self.result"""
+        self.metrics.count('duplicates_saved', self.requests_saved)
+        self.metrics.count('checkpoint_hits', self.resumed_translations)
+        self.metrics.count('batches', self.batches_sent)
+        if self.fonts:
+            self.metrics.count('insertion_failures', self.fonts.failures)
+        self.metrics.finish()
+        self.result['metrics'] = self.metrics.report()
+    
+    def write_metrics(self, json_path=None, prometheus_path=None):
+        """寫出本次執行（批次模式為全部文件加總）的指標：JSON 報告與 Prometheus textfile"""
+        info = {'engine': self.engine, 'model': self.model, 'target_lang': self.target_lang}
+        if self.result:
+            info.update(input=self.input_pdf, output=self.output_pdf, status=self.result['status'])
+        if json_path:
+            self.metrics.write_json(json_path, **info)
+            print(f"Metrics written to {json_path}")
+        if prometheus_path:
+            self.metrics.write_prometheus(prometheus_path, engine=self.engine, target_lang=self.target_lang)
+            print(f"Metrics written to {prometheus_path}")
+    
+    def process_batch(self, jobs, concurrency=2, force=False, summary_path=None):
+        """以同一個已就緒的引擎翻譯多份文件：最多 concurrency 份同時進行，略過已是最新的輸出"""
+        print("\n" + "="*70)
+        print("PDF Translation Tool - Batch Mode")
+        print("="*70)
+        print(f"\nDocuments: {len(jobs)}  Target language: {self.target_lang}  Concurrency: {concurrency}")
+        
+        results = [None] * len(jobs)
+        pending = []
+        for i, (input_pdf, output_pdf) in enumerate(jobs):
+            if not force and is_up_to_date(input_pdf, output_pdf):
+                results[i] = {'input': input_pdf, 'output': output_pdf, 'status': 'skipped'}
+            else:
+                pending.append(i)
+        if len(pending) < len(jobs):
+            print(f"   Skipping {len(jobs) - len(pending)} up-to-date document(s) (use --force to redo)")
+        
+        if pending:
+            if not self.prepare():
+                return False
+            self.metrics = RunMetrics()
+            started = time.perf_counter()
+            try:
+                # 執行緒池的佇列即工作佇列；翻譯請求、翻譯記憶與限速器在所有文件間共用
+                with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='document') as executor:
+                    futures = {}
+                    for i in pending:
+                        input_pdf, output_pdf = jobs[i]
+                        output_dir = os.path.dirname(output_pdf)
+                        if output_dir:
+                            os.makedirs(output_dir, exist_ok=True)
+                        job = self.for_document(input_pdf, output_pdf)
+                        futures[executor.submit(job.process_job)] = (i, job)
+                    for done, future in enumerate(as_completed(futures), 1):
+                        i, job = futures[future]
+                        results[i] = future.result()
+                        self.requests_saved += job.requests_saved
+                        self.resumed_translations += job.resumed_translations
+                        self.batches_sent += job.batches_sent
+                        self.metrics.merge(job.metrics)
+                        print(f"\n[{done}/{len(pending)}] {results[i]['status'].upper()}: {jobs[i][0]}")
+                print(f"\nBatch finished in {time.perf_counter() - started:.1f}s")
+                self._print_translation_stats()
+            finally:
+                self.metrics.finish()
+                self.close()
+        
+        self._print_batch_summary(results)
+        if summary_path:
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                json.dump({'target_lang': self.target_lang, 'documents': results}, f, ensure_ascii=False, indent=2)
+            print(f"Summary written to {summary_path}")
+        return all(result['status'] != 'failed' for result in results)
+    
+    def process_job(self):
+        """在批次的工作執行緒中處理一份文件，返回摘要"""
+        self.process()
+        return self.result
+    
+    def _print_batch_summary(self, results):
+        """輸出每份文件的結果"""
+        print("\n" + "="*70)
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+            if result['status'] == 'skipped':
+                detail = 'up to date'
+            elif result['status'] == 'ok':
+                detail = f"{result['translated']}/{result['segments']} segments in {result['seconds']:.1f}s"
+            else:
+                detail = result['error']
+            print(f"  {result['status']:<8} {os.path.basename(result['input'])}: {detail}")
+        print("  " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+        print("="*70 + "\n")
+    
+    def _checkpoint_fingerprint(self):
+        """描述目前工作的指紋；續傳時必須完全相同"""
+        stat = os.stat(self.input_pdf)
+        return {
+            'input': os.path.abspath(self.input_pdf),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'pages': self.pages,
+            'segment': self.segment,
+            'engine': self.engine,
+            'model': self.model,
+            'target_lang': self.target_lang
+        }
+    
+    def _run_staged(self):
+        """分階段模式：先提取全部頁面，再翻譯，最後套用，返回 (成功數, 總數)"""
+        # 讀取PDF
+        self.log("\n[1/4] Reading PDF and extracting text...", force=True)
+        self._report_progress('extract')
+        if self.checkpoint.pages_data is not None:
+            pages_data = self.checkpoint.pages_data
+            print(f"   Loaded extracted text of {len(pages_data)} pages from checkpoint")
+        else:
+            with self.pdf_lock, self.metrics.stage('extract'):
+                pages_data = self._extract_pages()
+            self.checkpoint.start(pages_data)
+        
+        total_texts = sum(len(texts) for _, texts in pages_data)
+        
+        # 翻譯
+        self.log(f"\n[2/4] Translating text ({self.translator.concurrency(self.workers)} worker(s))...", force=True)
+        def on_progress(translated_count, total):
+            self.progress.update(done=translated_count, total=total)
+            if self.verbose or translated_count % 100 == 0:
+                print(f"   Progress: {translated_count/total*100:.1f}% ({translated_count}/{total}) "
+                      f"@ {self.limiter.rate:.1f} req/s", end='\r')
+        
+        self._report_progress('translate')
+        with self.metrics.stage('translate'):
+            pool = self._translate_items([table for _, table in pages_data], on_progress)
+        print(f"\n   Translation completed in {pool.elapsed:.1f}s")
+        for line in pool.summary():
+            self.log(f"   {line}", force=True)
+        self._print_translation_stats()
+        
+        if self.apply_workers > 1 and len(pages_data) > 1:
+            # 各行程在自己的文件副本上套用翻譯，最後合併為輸出檔
+            self.log(f"\n[3/4] Applying translations ({self.apply_workers} processes)...", force=True)
+            
+            def on_progress(done_pages, total_pages):
+                self.progress = {'stage': 'apply', 'done': done_pages, 'total': total_pages}
+                if self.verbose:
+                    print(f"   Progress: {done_pages/total_pages*100:.1f}%", end='\r')
+            
+            self._report_progress('apply', 0, len(pages_data))
+            with self.pdf_lock, self.metrics.stage('apply'):
+                success, failures, link_failures, link_error = apply_pages_parallel(
+                    self.input_pdf, self.output_pdf, pages_data, self.apply_workers, on_progress, self.save_options,
+                    self.fonts.fontnames, self.redact
+                )
+            self.fonts.failures += failures
+            self._print_apply_result(success, total_texts)
+            if link_failures:
+                self.metrics.count('link_failures', link_failures)
+                print(f"   [WARNING] {link_failures} link(s) could not be restored")
+                self.log(f"   Last link error: {link_error!r}")
+            self.log("\n[4/4] Merged page shards into output PDF", force=True)
+            return success, total_texts
+        
+        # 直接在開啟的輸入文件上套用，最後一次寫出到輸出路徑
+        self.log("\n[3/4] Applying translations...", force=True)
+        self._report_progress('apply', 0, len(pages_data))
+        with self.pdf_lock:
+            doc = fitz.open(self.input_pdf)
+            success = 0
+            
+            with self.metrics.stage('apply'):
+                for done_pages, (page_num, page_texts) in enumerate(pages_data, 1):
+                    success += apply_page_translations(doc[page_num], page_texts, self.fonts, self.redact, self.metrics)
+                    self.progress['done'] = done_pages
+                    
+                    if self.verbose:
+                        print(f"   Progress: {done_pages/len(pages_data)*100:.1f}%", end='\r')
+            
+            self._print_apply_result(success, total_texts)
+            
+            # 保存
+            self.log("\n[4/4] Saving PDF...", force=True)
+            self.progress['stage'] = 'save'
+            with self.metrics.stage('save'):
+                write_output(doc, self.output_pdf, **self.save_options)
+        return success, total_texts
+    
+    def _extract_pages(self):
+        """提取所選頁面的文字區塊，返回 [(頁碼, 文字區塊), ...]"""
+        doc = fitz.open(self.input_pdf)
+        page_range = self._resolve_page_range(len(doc))
+        started = time.perf_counter()
+        
+        if self.extract_workers > 1 and len(page_range) > 1:
+            doc.close()
+            
+            def on_progress(done_pages, total_pages):
+                self.progress['done'] = done_pages
+                if self.verbose:
+                    print(f"   Progress: {done_pages/total_pages*100:.1f}%", end='\r')
+            
+            self.progress['total'] = len(page_range)
+            self.log(f"   Using {self.extract_workers} extraction processes", force=True)
+            pages_data = extract_pages_parallel(
+                self.input_pdf, page_range, self.extract_workers, on_progress, self.segment
+            )
+        else:
+            pages_data = []
+            self.progress['total'] = len(page_range)
+            for page_num in page_range:
+                pages_data.append((page_num, extract_page_spans(doc[page_num], page_num, self.segment)))
+                self.progress['done'] = len(pages_data)
+                
+                if self.verbose:
+                    print(f"   Progress: {(len(pages_data))/len(page_range)*100:.1f}%", end='\r')
+            doc.close()
+        
+        total_texts = sum(len(texts) for _, texts in pages_data)
+        print(f"\n   Extracted {total_texts} text segments from {len(page_range)} pages "
+              f"in {time.perf_counter() - started:.1f}s")
+        return pages_data
+    
+    def _run_streaming(self):
+        """串流模式：提取、翻譯與套用逐頁重疊進行，同時保留提取結果與譯文的頁數以 stream_window 為上限；
+        已套用的頁面仍留在文件中直到最後一次寫出，返回 (成功數, 總數)"""
+        self.log(f"\n[1/2] Streaming pages (window: {self.stream_window} pages, "
+                 f"{self.translator.concurrency(self.workers)} worker(s))...", force=True)
+        # 提取與套用使用同一個文件：每頁都先提取、之後才套用，不會讀到已修改的內容
+        with self.pdf_lock:
+            doc = fitz.open(self.input_pdf)
+            page_count = len(doc)
+        try:
+            page_range = self._resolve_page_range(page_count)
+            self._report_progress('stream', 0, len(page_range))
+            self.checkpoint.start()
+            total_texts = 0
+            success = 0
+            applied_pages = 0
+            in_flight = deque()
+            
+            def apply_oldest():
+                nonlocal success, applied_pages
+                page_num, page_texts, future = in_flight.popleft()
+                with self.metrics.stage('translate_wait'):
+                    future.result()
+                with self.pdf_lock, self.metrics.stage('apply'):
+                    success += apply_page_translations(doc[page_num], page_texts, self.fonts, self.redact, self.metrics)
+                applied_pages += 1
+                self.progress['done'] = applied_pages
+                if self.verbose or applied_pages % 10 == 0:
+                    print(f"   Progress: {applied_pages}/{len(page_range)} pages "
+                          f"@ {self.limiter.rate:.1f} req/s", end='\r')
+            
+            # 窗口內的各頁在背景執行緒同時翻譯，合計的請求數仍以 workers 為上限；
+            # PyMuPDF 非執行緒安全，提取與套用都留在本執行緒並持有 pdf_lock
+            slots = threading.Semaphore(self.translator.concurrency(self.workers))
+            with ThreadPoolExecutor(max_workers=self.stream_window, thread_name_prefix='stage') as stage:
+                for page_num in page_range:
+                    with self.pdf_lock, self.metrics.stage('extract'):
+                        page_texts = extract_page_spans(doc[page_num], page_num, self.segment)
+                    total_texts += len(page_texts)
+                    in_flight.append((page_num, page_texts, stage.submit(self._translate_page, page_texts, slots)))
+                    
+                    while in_flight and (len(in_flight) >= self.stream_window or in_flight[0][2].done()):
+                        apply_oldest()
+                while in_flight:
+                    apply_oldest()
+            
+            self._print_apply_result(success, total_texts)
+            self._print_translation_stats()
+            
+            self.log("\n[2/2] Saving PDF...", force=True)
+            self.progress['stage'] = 'save'
+        except Exception:
+            with self.pdf_lock:
+                doc.close()
+            raise
+        with self.pdf_lock, self.metrics.stage('save'):
+            write_output(doc, self.output_pdf, **self.save_options)
+        return success, total_texts
+    
+    def _translate_page(self, page_texts, slots):
+        """串流模式的背景翻譯：翻譯單頁並累計 translate 階段耗時（各頁同時進行時會重疊）"""
+        with self.metrics.stage('translate'):
+            return self._translate_items([page_texts], slots=slots)
+    
+    def _resolve_page_range(self, total_pages):
+        """確定要處理的頁面範圍"""
+        if self.pages:
+            page_range = self._parse_page_range(self.pages, total_pages)
+            self.log(f"   Processing pages: {page_range}", force=True)
+        else:
+            page_range = range(total_pages)
+            self.log(f"   Processing all {total_pages} pages", force=True)
+        return page_range
+    
+    def _translate_items(self, tables, on_progress=None, slots=None):
+        """翻譯尚未記在檢查點的原文，結果寫回各 SpanTable 的 translated 並記錄到檢查點，返回使用的翻譯池；
+        slots 為多頁同時翻譯時共用的請求數上限"""
+        # 取消時拋出 TranslationCancelled；已完成的翻譯都記在檢查點，之後可用 --resume 接續
+        pool, stats = self.dispatcher().translate_tables(
+            tables, self.translator.concurrency(self.workers), on_progress, slots, self.async_requests,
+            lookup=self.checkpoint.lookup if self.checkpoint else None,
+            on_translated=self.checkpoint.record if self.checkpoint else None
+        )
+        with self.stats_lock:
+            self.requests_saved += stats['duplicates_saved']
+            self.resumed_translations += stats['resumed']
+            self.batches_sent += stats['batches']
+        return pool
+    
+    def _print_apply_result(self, success, total_texts):
+        """輸出套用階段的成功數與插入失敗數"""
+        print(f"\n   Successfully applied {success}/{total_texts} translations")
+        if self.fonts.failures:
+            print(f"   [WARNING] {self.fonts.failures} insertion(s) failed")
+            self.log(f"   Last insertion error: {self.fonts.last_error!r}")
+    
+    def _print_translation_stats(self):
+        """輸出去重、批次、限速與翻譯記憶統計"""
+        print(f"   Duplicate requests saved: {self.requests_saved}")
+        if self.resumed_translations:
+            print(f"   Resumed from checkpoint: {self.resumed_translations}")
+        if self.batches_sent:
+            print(f"   Batched requests sent: {self.batches_sent}")
+        print(f"   Rate limiter: {self.limiter.rate:.1f} req/s "
+              f"({self.limiter.successes} ok, {self.limiter.failures} throttled/failed)")
+        if self.memory:
+            print(f"   Translation memory: {self.memory.hits} hits, {self.memory.misses} misses")
+        histograms = self.metrics.report()['histograms']
+        if 'ttft_seconds' in histograms:
+            print(f"   Time to first token: {histograms['ttft_seconds']['mean'] * 1000:.0f} ms avg, "
+                  f"generation {histograms.get('tokens_per_second', {}).get('mean', 0.0):.1f} tokens/s avg")
+        if self.metrics.counters.get('runaway_cutoffs'):
+            print(f"   Runaway outputs stopped early: {self.metrics.counters['runaway_cutoffs']}")
     
     def _parse_page_range(self, pages_str, total_pages):
         """解析頁面範圍字符串，例如 '1-10,15,20-25'"""
@@ -350,6 +2621,7 @@ Translation:"""
         return sorted(page_set)
 
 def main():
+    configure_stdout()
     parser = argparse.ArgumentParser(
         description='PDF Translation Tool - Translate PDF files while preserving images and layout',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -366,11 +2638,78 @@ Examples:
   
   # Translate with verbose output
   python pdf_translator.py input.pdf output.pdf -v
+  
+  # Keep 4 translation requests in flight
+  python pdf_translator.py input.pdf output.pdf --workers 4
+  
+  # Send one span per Ollama request instead of batched prompts
+  python pdf_translator.py input.pdf output.pdf --engine ollama --batch-tokens 0
+  
+  # Start Google requests at 5/s and never exceed 10/s
+  python pdf_translator.py input.pdf output.pdf --rate 5 --max-rate 10
+  
+  # Overlap extract/translate/apply so translation starts before extraction finishes
+  python pdf_translator.py input.pdf output.pdf --stream --stream-window 8
+  
+  # Extract text and apply translations on all CPU cores
+  python pdf_translator.py input.pdf output.pdf --extract-workers 0 --apply-workers 0
+  
+  # Translate whole lines instead of individual font spans
+  python pdf_translator.py input.pdf output.pdf --segment line
+  
+  # Paint white boxes over the original text (covers images underneath)
+  python pdf_translator.py input.pdf output.pdf --redact fill
+  
+  # Maximum compaction of the output file
+  python pdf_translator.py input.pdf output.pdf --garbage 4
+  
+  # Continue an interrupted job from its checkpoint
+  python pdf_translator.py input.pdf output.pdf --resume
+  
+  # Skip the translation memory (always call the engine)
+  python pdf_translator.py input.pdf output.pdf --no-cache
+  
+  # Translate every PDF in a folder, 4 documents at a time
+  python pdf_translator.py --input-dir papers/ --output-dir papers_zh/ --jobs 4
+  
+  # Translate the documents listed in a manifest (input<TAB>output per line)
+  python pdf_translator.py --manifest jobs.txt --summary summary.json
+  
+  # Write a JSON run report and a Prometheus textfile
+  python pdf_translator.py input.pdf output.pdf --metrics-json run.json --metrics-prom /var/lib/node_exporter/pdf_translator.prom
         """
     )
     
-    parser.add_argument('input', help='Input PDF file path')
-    parser.add_argument('output', help='Output PDF file path')
+    parser.add_argument('input', nargs='?', help='Input PDF file path')
+    parser.add_argument('output', nargs='?', help='Output PDF file path')
+    parser.add_argument(
+        '--input-dir',
+        help='Batch mode: translate every PDF under this folder (requires --output-dir)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        help='Batch mode: output folder; mirrors the layout of --input-dir'
+    )
+    parser.add_argument(
+        '--manifest',
+        help='Batch mode: file listing one document per line as "input<TAB>output" (output optional)'
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=2,
+        help='Batch mode: documents translated at the same time (default: 2)'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Batch mode: also translate documents whose output is newer than the input'
+    )
+    parser.add_argument(
+        '--summary',
+        help='Batch mode: write a JSON summary of every document to this path '
+             '(default: batch-summary.json in --output-dir)'
+    )
     parser.add_argument(
         '--lang', '-l',
         default='zh-TW',
@@ -387,9 +2726,121 @@ Examples:
     )
     parser.add_argument(
         '--engine', '-e',
-        choices=['google', 'ollama'],
+        choices=sorted(ENGINES),
         default='google',
-        help='Translation engine: google (default) or ollama (requires Ollama running locally)'
+        help='Translation engine: google (default), ollama (requires Ollama running locally) '
+             'or mock (offline fake translations for testing)'
+    )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='Number of concurrent translation requests (default: 1)'
+    )
+    parser.add_argument(
+        '--batch-tokens',
+        type=int,
+        default=1000,
+        help='Approximate token budget per batched Ollama prompt; 0 sends one span per request (default: 1000)'
+    )
+    parser.add_argument(
+        '--async',
+        dest='async_requests',
+        action='store_true',
+        help='Send requests from one asyncio event loop instead of a thread per worker (ollama only)'
+    )
+    parser.add_argument(
+        '--batch-chars',
+        type=int,
+        default=5000,
+        help='Character budget per combined Google request; 0 sends one span per request (default: 5000)'
+    )
+    parser.add_argument(
+        '--rate',
+        type=float,
+        help='Initial request rate per second; adapts on success/throttling '
+             '(default: google 2, ollama 10)'
+    )
+    parser.add_argument(
+        '--max-rate',
+        type=float,
+        help='Upper bound for the adaptive request rate (default: google 20, ollama 200)'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Overlap extraction, translation and applying page by page; peak memory still grows with page count'
+    )
+    parser.add_argument(
+        '--stream-window',
+        type=int,
+        default=4,
+        help='Pages extracted and translating at once in --stream mode (default: 4)'
+    )
+    parser.add_argument(
+        '--extract-workers',
+        type=int,
+        default=1,
+        help='Processes used for text extraction; 0 uses all CPU cores (default: 1)'
+    )
+    parser.add_argument(
+        '--apply-workers',
+        type=int,
+        default=1,
+        help='Processes used for redaction and text insertion; 0 uses all CPU cores (default: 1)'
+    )
+    parser.add_argument(
+        '--segment',
+        choices=SEGMENT_MODES,
+        default='span',
+        help='Translation unit: span (default), line (merge spans of a line) '
+             'or block (merge lines of a text block)'
+    )
+    parser.add_argument(
+        '--redact',
+        choices=REDACT_MODES,
+        default='text',
+        help='How original text is removed: text (remove text only, keep images and line art; default) '
+             'or fill (white boxes over the text area)'
+    )
+    parser.add_argument(
+        '--garbage',
+        type=int,
+        choices=range(5),
+        default=3,
+        help='Output garbage collection: 0 none, 1 drop unused objects, 2 also compact xref, '
+             '3 also merge duplicate objects (default), 4 also merge duplicate streams'
+    )
+    parser.add_argument(
+        '--no-deflate',
+        action='store_true',
+        help='Do not compress content, image and font streams in the output'
+    )
+    parser.add_argument(
+        '--checkpoint',
+        help='Checkpoint journal path (default: <output>.checkpoint)'
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='Resume an interrupted job from its checkpoint'
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help=f'Translation memory directory (default: {default_cache_dir()})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Disable the persistent translation memory'
+    )
+    parser.add_argument(
+        '--metrics-json',
+        help='Write a JSON run report (stage times, request latency histograms, counters, peak memory) to this path'
+    )
+    parser.add_argument(
+        '--metrics-prom',
+        help='Also write the run metrics in Prometheus textfile format to this path (e.g. for node_exporter)'
     )
     parser.add_argument(
         '--version',
@@ -399,6 +2850,17 @@ Examples:
     
     args = parser.parse_args()
     
+    batch = bool(args.input_dir or args.manifest)
+    if batch:
+        if args.input or args.output:
+            parser.error('input/output cannot be combined with --input-dir or --manifest')
+        if args.input_dir and not args.output_dir:
+            parser.error('--input-dir requires --output-dir')
+        if args.checkpoint:
+            parser.error('--checkpoint cannot be used in batch mode (each output gets <output>.checkpoint)')
+    elif not (args.input and args.output):
+        parser.error('input and output are required unless --input-dir or --manifest is given')
+    
     # 創建翻譯器並執行
     translator = PDFTranslatorCLI(
         args.input,
@@ -406,10 +2868,40 @@ Examples:
         target_lang=args.lang,
         pages=args.pages,
         verbose=args.verbose,
-        engine=args.engine
+        engine=args.engine,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        batch_tokens=args.batch_tokens,
+        batch_chars=args.batch_chars,
+        rate=args.rate,
+        max_rate=args.max_rate,
+        stream=args.stream,
+        stream_window=args.stream_window,
+        extract_workers=args.extract_workers,
+        apply_workers=args.apply_workers,
+        checkpoint_path=args.checkpoint,
+        resume=args.resume,
+        segment=args.segment,
+        garbage=args.garbage,
+        deflate=not args.no_deflate,
+        redact=args.redact,
+        async_requests=args.async_requests
     )
     
-    success = translator.process()
+    if batch:
+        jobs = []
+        if args.input_dir:
+            jobs.extend(collect_batch_jobs(args.input_dir, args.output_dir))
+        if args.manifest:
+            jobs.extend(read_manifest(args.manifest, args.output_dir))
+        summary_path = args.summary or (os.path.join(args.output_dir, 'batch-summary.json') if args.output_dir else None)
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        success = translator.process_batch(jobs, args.jobs, args.force, summary_path)
+    else:
+        success = translator.process()
+    translator.write_metrics(args.metrics_json, args.metrics_prom)
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
@@ -6,13 +6,18 @@ PDF翻譯工具 - Windows GUI版本
 
 import fitz
 import os
-import time
-import shutil
+import queue
 import threading
+import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from pathlib import Path
 
+from pdf_translator import (
+    FontManager, RateLimiter, RunMetrics, TranslationCancelled, TranslationDispatcher, TranslationMemory,
+    apply_page_translations, create_engine, extract_page_spans, write_output
+)
+
 class PDFTranslatorGUI:
     def __init__(self, root):
         self.root = root
@@ -32,9 +37,15 @@ class PDFTranslatorGUI:
         self.output_file = None
         self.engine = 'google'  # 'google' or 'ollama'
         self.ollama_model = None  # 將在 setup_translator 時自動檢測
+        self.memory = None  # 翻譯記憶，在 translate_pdf 時開啟
+        self.limiter = RateLimiter.for_engine(self.engine)
+        self.metrics = RunMetrics()  # 最近一次翻譯的階段耗時與請求統計
+        # Tk 不是執行緒安全的：背景執行緒（含翻譯池的工作執行緒）的介面更新放進佇列，由主迴圈取出執行
+        self.ui_queue = queue.Queue()
         
         self.setup_ui()
         self.setup_translator()
+        self.drain_ui_queue()
     
     def setup_ui(self):
         """建立使用者介面"""
@@ -229,6 +240,42 @@ class PDFTranslatorGUI:
             fg="gray"
         ).pack(side=tk.LEFT)
         
+        # 並行請求數
+        workers_frame = tk.Frame(options_frame)
+        workers_frame.pack(fill=tk.X, pady=5)
+        
+        tk.Label(
+            workers_frame,
+            text="並行請求：",
+            font=("Microsoft JhengHei", 9)
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.workers_var = tk.IntVar(value=1)
+        tk.Spinbox(
+            workers_frame,
+            from_=1,
+            to=16,
+            textvariable=self.workers_var,
+            font=("Consolas", 9),
+            width=5,
+            state="readonly"
+        ).pack(side=tk.LEFT, padx=(0, 10))
+        
+        tk.Label(
+            workers_frame,
+            text="(同時送出的翻譯請求數)",
+            font=("Microsoft JhengHei", 8),
+            fg="gray"
+        ).pack(side=tk.LEFT)
+        
+        self.use_cache_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            workers_frame,
+            text="使用翻譯記憶",
+            variable=self.use_cache_var,
+            font=("Microsoft JhengHei", 9)
+        ).pack(side=tk.RIGHT)
+        
         # 進度顯示區域
         progress_frame = tk.LabelFrame(
             main_frame,
@@ -309,8 +356,9 @@ class PDFTranslatorGUI:
         """初始化翻譯器"""
         if self.engine == 'google':
             try:
-                from googletrans import Translator
-                self.translator = Translator()
+                translator = create_engine('google', limiter=self.limiter, log=self.log_detail)
+                translator.setup()
+                self.translator = translator
                 self.log_detail("✓ Google Translate 引擎已就緒")
             except ImportError:
                 messagebox.showerror(
@@ -335,7 +383,8 @@ class PDFTranslatorGUI:
                         
                         if selected_model in model_names:
                             self.ollama_model = selected_model
-                            self.translator = True  # 標記為已就緒
+                            self.translator = create_engine('ollama', model=selected_model, limiter=self.limiter,
+                                                            log=self.log_detail)
                             self.log_detail(f"✓ Ollama 引擎已就緒 (model: {self.ollama_model})")
                         else:
                             messagebox.showerror(
@@ -471,8 +520,28 @@ class PDFTranslatorGUI:
             self.output_path_var.set(filename)
             self.log_detail(f"✓ 已設定輸出位置：{os.path.basename(filename)}")
     
+    def drain_ui_queue(self):
+        """在主執行緒執行背景執行緒排入的介面更新"""
+        while True:
+            try:
+                func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            func(*args)
+        self.root.after(50, self.drain_ui_queue)
+    
+    def run_on_ui_thread(self, func, *args):
+        """在主執行緒呼叫 func；從背景執行緒呼叫時排入佇列"""
+        if threading.current_thread() is threading.main_thread():
+            func(*args)
+        else:
+            self.ui_queue.put((func, args))
+    
     def log_detail(self, message):
         """記錄詳細資訊"""
+        if threading.current_thread() is not threading.main_thread():
+            self.ui_queue.put((self.log_detail, (message,)))
+            return
         self.detail_text.config(state="normal")
         self.detail_text.insert(tk.END, f"{message}\n")
         self.detail_text.see(tk.END)
@@ -481,11 +550,17 @@ class PDFTranslatorGUI:
     
     def update_status(self, message):
         """更新狀態訊息"""
+        if threading.current_thread() is not threading.main_thread():
+            self.ui_queue.put((self.update_status, (message,)))
+            return
         self.status_var.set(message)
         self.root.update_idletasks()
     
     def update_progress(self, value):
         """更新進度條"""
+        if threading.current_thread() is not threading.main_thread():
+            self.ui_queue.put((self.update_progress, (value,)))
+            return
         self.progress_bar['value'] = value
         self.root.update_idletasks()
     
@@ -522,6 +597,9 @@ class PDFTranslatorGUI:
     def stop_translation(self):
         """停止翻譯"""
         self.is_translating = False
+        # Ollama 的串流請求立即中止，不必等生成結束
+        if self.translator:
+            self.translator.abort_requests()
         self.update_status("正在停止...")
         self.log_detail("✗ 使用者已取消翻譯")
     
@@ -530,6 +608,7 @@ class PDFTranslatorGUI:
         try:
             # 解析語言代碼
             lang_code = self.lang_var.get().split()[0]
+            self.metrics = RunMetrics()
             
             # 開始處理
             self.update_status("正在讀取 PDF 檔案...")
@@ -561,24 +640,8 @@ class PDFTranslatorGUI:
                 if not self.is_translating:
                     raise Exception("使用者取消")
                 
-                page = doc[page_num]
-                blocks = page.get_text("dict")["blocks"]
-                
-                texts = []
-                for block in blocks:
-                    if block["type"] == 0:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                if span["text"].strip() and len(span["text"].strip()) > 1:
-                                    texts.append({
-                                        'page_num': page_num,
-                                        'bbox': span["bbox"],
-                                        'text': span["text"],
-                                        'size': span["size"],
-                                        'color': span.get("color", 0)
-                                    })
-                
-                pages_data.append((page_num, texts))
+                with self.metrics.stage('extract'):
+                    pages_data.append((page_num, extract_page_spans(doc[page_num], page_num)))
                 progress = (idx + 1) / len(page_range) * 20
                 self.update_progress(progress)
                 self.update_status(f"正在提取文字 ({idx + 1}/{len(page_range)})...")
@@ -587,108 +650,81 @@ class PDFTranslatorGUI:
             self.log_detail(f"✓ 已提取 {total_texts} 個文字區塊")
             doc.close()
             
+            # 翻譯記憶
+            if self.use_cache_var.get():
+                try:
+                    self.memory = TranslationMemory()
+                    self.log_detail(f"✓ 翻譯記憶：{self.memory.path}")
+                except Exception as e:
+                    self.log_detail(f"✗ 無法開啟翻譯記憶：{e}")
+                    self.memory = None
+            
             # 翻譯文字
+            self.limiter = self.translator.limiter = RateLimiter.for_engine(self.engine)
+            workers = self.translator.concurrency(self.workers_var.get())
             self.update_status("正在翻譯文字...")
-            translated_count = 0
-            
-            for page_idx, (page_num, page_texts) in enumerate(pages_data):
-                if not self.is_translating:
-                    raise Exception("使用者取消")
-                
-                for item in page_texts:
-                    if not self.is_translating:
-                        raise Exception("使用者取消")
-                    
-                    try:
-                        if self.engine == 'google':
-                            result = self.translator.translate(item['text'], dest=lang_code)
-                            item['translated'] = result.text
-                            time.sleep(0.5)
-                        elif self.engine == 'ollama':
-                            item['translated'] = self._translate_with_ollama(item['text'], lang_code)
-                            time.sleep(0.1)
-                    except Exception as e:
-                        self.log_detail(f"✗ 翻譯失敗：{item['text'][:20]}... ({e})")
-                        item['translated'] = item['text']
-                    
-                    translated_count += 1
-                    progress = 20 + (translated_count / total_texts * 60)
-                    self.update_progress(progress)
-                    self.update_status(f"正在翻譯 ({translated_count}/{total_texts})...")
+            self.log_detail(f"✓ 並行請求數：{workers}")
+            def on_progress(translated_count, total):
+                progress = 20 + (translated_count / total * 60)
+                self.update_progress(progress)
+                self.update_status(f"正在翻譯 ({translated_count}/{total})... {self.limiter.rate:.1f} 次/秒")
             
-            self.log_detail(f"✓ 已完成 {translated_count} 個文字區塊的翻譯")
+            # 與 CLI 共用：合併重複文字、查詢翻譯記憶，依引擎能力分組（Ollama 會把多段合併成單一提示詞）後並行送出
+            dispatcher = TranslationDispatcher(self.translator, self.engine, lang_code, self.memory, self.metrics,
+                                               lambda: not self.is_translating)
+            translate_started = time.perf_counter()
+            try:
+                pool, stats = dispatcher.translate_tables([table for _, table in pages_data], workers, on_progress)
+            except TranslationCancelled:
+                raise Exception("使用者取消")
+            self.metrics.add_time('translate', time.perf_counter() - translate_started)
+            self.log_detail(f"✓ 合併重複文字：{stats['unique']} 個唯一區塊（節省 {stats['duplicates_saved']} 次請求）")
+            if stats['batches']:
+                self.log_detail(f"✓ 合併為 {stats['requests']} 個批次請求")
             
-            # 創建輸出PDF
-            self.update_status("正在建立輸出檔案...")
-            if os.path.exists(self.output_file):
-                os.remove(self.output_file)
-            shutil.copy2(self.input_file, self.output_file)
+            self.log_detail(f"✓ 已完成 {total_texts} 個文字區塊的翻譯（{pool.elapsed:.1f} 秒）")
+            for line in pool.summary():
+                self.log_detail(f"  {line}")
+            self.log_detail(f"✓ 目前請求速率：{self.limiter.rate:.1f} 次/秒（限流/失敗 {self.limiter.failures} 次）")
+            if self.memory:
+                self.log_detail(f"✓ 翻譯記憶命中 {self.memory.hits} 次，未命中 {self.memory.misses} 次")
+            histograms = self.metrics.report()['histograms']
+            if 'ttft_seconds' in histograms:
+                self.log_detail(f"✓ 首個 token 平均 {histograms['ttft_seconds']['mean'] * 1000:.0f} 毫秒，"
+                                f"生成速度平均 {histograms.get('tokens_per_second', {}).get('mean', 0.0):.1f} tokens/秒")
+            if self.metrics.counters.get('runaway_cutoffs'):
+                self.log_detail(f"⚠ {self.metrics.counters['runaway_cutoffs']} 個過長的輸出已提前停止")
             
-            doc = fitz.open(self.output_file)
+            # 直接在開啟的輸入文件上套用，最後一次寫出到輸出路徑
+            doc = fitz.open(self.input_file)
+            fonts = FontManager()
             
             # 應用翻譯
             self.update_status("正在套用翻譯...")
             success = 0
             
-            for page_idx, (page_num, page_texts) in enumerate(pages_data):
+            for page_idx, (page_num, table) in enumerate(pages_data):
                 if not self.is_translating:
+                    doc.close()
                     raise Exception("使用者取消")
                 
-                page = doc[page_num]
-                
-                # 覆蓋原文
-                for item in page_texts:
-                    page.add_redact_annot(fitz.Rect(item['bbox']), fill=(1, 1, 1))
-                page.apply_redactions()
-                
-                # 插入翻譯
-                for item in page_texts:
-                    if not self.is_translating:
-                        raise Exception("使用者取消")
-                    
-                    translated = item['translated']
-                    bbox = item['bbox']
-                    size = item['size']
-                    color = item['color']
-                    
-                    if color:
-                        r = ((color >> 16) & 0xFF) / 255.0
-                        g = ((color >> 8) & 0xFF) / 255.0
-                        b = (color & 0xFF) / 255.0
-                        text_color = (r, g, b)
-                    else:
-                        text_color = (0, 0, 0)
-                    
-                    adjusted_size = max(size * 0.7, 6)
-                    baseline_y = bbox[1] + size * 0.75
-                    
-                    # 使用內建CJK字體
-                    for fontname in ["china-ss", "china-s", "cjk"]:
-                        try:
-                            rc = page.insert_text(
-                                (bbox[0], baseline_y),
-                                translated,
-                                fontname=fontname,
-                                fontsize=adjusted_size,
-                                color=text_color
-                            )
-                            if rc > 0:
-                                success += 1
-                                break
-                        except:
-                            continue
+                with self.metrics.stage('apply'):
+                    success += apply_page_translations(doc[page_num], table, fonts, metrics=self.metrics)
                 
                 progress = 80 + ((page_idx + 1) / len(pages_data) * 15)
                 self.update_progress(progress)
                 self.update_status(f"正在套用翻譯 ({page_idx + 1}/{len(pages_data)} 頁)...")
             
             self.log_detail(f"✓ 已成功套用 {success}/{total_texts} 個翻譯")
+            if fonts.failures:
+                self.log_detail(f"⚠ {fonts.failures} 個翻譯插入失敗：{fonts.last_error}")
             
             # 保存
             self.update_status("正在儲存檔案...")
             self.update_progress(95)
-            doc.saveIncr()
-            doc.close()
+            with self.metrics.stage('save'):
+                write_output(doc, self.output_file)
+            self.metrics.finish()
             
             output_size = os.path.getsize(self.output_file) / (1024*1024)
             
@@ -700,24 +736,30 @@ class PDFTranslatorGUI:
             self.log_detail(f"✓ 輸出檔案：{self.output_file}")
             self.log_detail(f"✓ 檔案大小：{output_size:.2f} MB")
             self.log_detail(f"✓ 成功翻譯：{success}/{total_texts} 個文字區塊")
+            self.log_detail("✓ 各階段耗時：" + "，".join(f"{name} {seconds:.1f} 秒" for name, seconds in self.metrics.stages.items()))
             self.log_detail("="*60)
             
             # 顯示完成訊息
-            self.root.after(0, lambda: messagebox.showinfo(
+            self.run_on_ui_thread(
+                messagebox.showinfo,
                 "完成",
                 f"翻譯完成！\n\n已翻譯 {success}/{total_texts} 個文字區塊\n輸出檔案：{os.path.basename(self.output_file)}"
-            ))
+            )
             
         except Exception as e:
             error_msg = str(e)
             self.log_detail(f"✗ 錯誤：{error_msg}")
             self.update_status(f"錯誤：{error_msg}")
-            self.root.after(0, lambda: messagebox.showerror("錯誤", f"翻譯失敗：{error_msg}"))
+            self.run_on_ui_thread(messagebox.showerror, "錯誤", f"翻譯失敗：{error_msg}")
         
         finally:
+            if self.memory:
+                self.memory.close()
+                self.memory = None
+            
             # 恢復按鈕狀態
-            self.root.after(0, lambda: self.translate_btn.config(state="normal"))
-            self.root.after(0, lambda: self.stop_btn.config(state="disabled"))
+            self.run_on_ui_thread(self.translate_btn.config, {'state': "normal"})
+            self.run_on_ui_thread(self.stop_btn.config, {'state': "disabled"})
             self.is_translating = False
     
     def _parse_page_range(self, pages_str, total_pages):
@@ -735,79 +777,6 @@ class PDFTranslatorGUI:
                 if 0 <= page_num < total_pages:
                     page_set.add(page_num)
         return sorted(page_set)
-    
-    def _translate_with_ollama(self, text, lang_code):
-        """使用 Ollama 翻譯文本"""
-        if not text or len(text.strip()) < 2:
-            return text
-        
-        try:
-            import requests
-            
-            # 根據目標語言設定提示詞
-            lang_names = {
-                'zh-TW': '繁體中文',
-                'zh-CN': '简体中文',
-                'en': 'English',
-                'ja': '日本語',
-                'ko': '한국어',
-                'fr': 'français',
-                'de': 'Deutsch',
-                'es': 'español',
-                'pt': 'português',
-                'ru': 'русский'
-            }
-            target_lang_name = lang_names.get(lang_code, lang_code)
-            
-            # 優化提示詞，使用更明確的指示
-            prompt = f"""You are a professional translator. Translate the following text to {target_lang_name}.
-Rules:
-- Only provide the translation
-- Do not include any explanations, notes, or the original text
-- Maintain the original meaning and tone
-- Keep proper nouns and technical terms appropriate
-
-Text to translate:
-{text}
-
-Translation:"""
-            
-            response = requests.post(
-                'http://localhost:11434/api/generate',
-                json={
-                    'model': self.ollama_model,
-                    'prompt': prompt,
-                    'stream': False,
-                    'options': {
-                        'temperature': 0.3,  # 降低隨機性，提高準確性
-                        'top_p': 0.9
-                    }
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                translated = result.get('response', '').strip()
-                
-                # 清理可能的多餘內容
-                # 移除可能的引號或標記
-                if translated:
-                    # 移除開頭和結尾的引號
-                    translated = translated.strip('"\'')
-                    # 如果翻譯結果包含"Translation:"等標籤，移除它
-                    if translated.lower().startswith('translation:'):
-                        translated = translated[12:].strip()
-                    # 移除可能的換行符號
-                    translated = translated.strip()
-                
-                return translated if translated and translated != text else text
-            else:
-                self.log_detail(f"✗ Ollama API 錯誤：HTTP {response.status_code}")
-                return text
-        except Exception as e:
-            self.log_detail(f"✗ Ollama 翻譯錯誤：{e}")
-            return text
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+PDF翻譯工具 - 本機服務版本
+常駐執行並保持翻譯引擎就緒，透過本機 HTTP 介面提交、查詢、下載與取消翻譯工作
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+from pdf_translator import (
+    ENGINES, REDACT_MODES, SEGMENT_MODES, PDFTranslatorCLI, RunMetrics, configure_stdout, default_cache_dir
+)
+
+
+def content_disposition(filename):
+    """返回譯文下載的 Content-Disposition 標頭值"""
+    # filename 來自查詢字串：去掉路徑、控制字元與引號，非 ASCII 檔名另以 filename*（RFC 5987）保留
+    stem = os.path.splitext(os.path.basename(filename.replace('\\', '/')))[0]
+    stem = ''.join(ch for ch in stem if ch.isprintable() and ch not in '"\\;') or 'document'
+    name = f'{stem}_translated.pdf'
+    fallback = name.encode('ascii', 'replace').decode('ascii').replace('?', '_')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
+
+
+class ServiceJob:
+    """服務中的單一翻譯工作"""
+
+    def __init__(self, job_id, filename, job_dir, worker):
+        self.id = job_id
+        self.filename = filename
+        self.dir = job_dir
+        self.worker = worker  # 共用引擎的 PDFTranslatorCLI 文件工作
+        self.status = 'queued'  # queued、running、done、failed、cancelled
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def describe(self):
+        """返回可序列化為 JSON 的工作狀態"""
+        info = {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'target_lang': self.worker.target_lang,
+            'pages': self.worker.pages,
+            'progress': dict(self.worker.progress),
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished
+        }
+        if self.worker.result and not self.active:
+            info['result'] = {key: value for key, value in self.worker.result.items() if key not in ('input', 'output')}
+        return info
+
+
+class TranslationService:
+    """以一個已就緒的引擎處理提交的工作：最多 jobs 份同時翻譯，排隊數達 queue_size 時拒絕新工作"""
+
+    def __init__(self, engine, spool_dir, jobs=2, queue_size=16):
+        self.engine = engine
+        self.spool_dir = spool_dir
+        self.queue_size = queue_size
+        self.metrics = RunMetrics()  # 服務啟動以來所有已結束工作的指標加總
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='job')
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def counts(self):
+        """返回各狀態的工作數"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def submit(self, data, filename, target_lang=None, pages=None):
+        """保存上傳的 PDF 並排入佇列；佇列已滿時返回 None"""
+        # 上傳最大可達數百 MB，先在鎖外寫入磁碟，寫檔期間不會擋住狀態查詢與 /health
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir)
+        input_pdf = os.path.join(job_dir, 'input.pdf')
+        with open(input_pdf, 'wb') as f:
+            f.write(data)
+        
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == 'queued')
+            if queued < self.queue_size:
+                worker = self.engine.for_document(input_pdf, os.path.join(job_dir, 'output.pdf'))
+                worker.pages = pages
+                if target_lang and target_lang != self.engine.target_lang:
+                    worker.target_lang = target_lang
+                job = self._jobs[job_id] = ServiceJob(job_id, filename, job_dir, worker)
+                job.future = self._executor.submit(self._run, job)
+                return job
+        # 寫檔期間佇列已滿
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return None
+
+    def _run(self, job):
+        with self._lock:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+            job.started = time.time()
+        try:
+            job.worker.process()
+        finally:
+            status = job.worker.result['status'] if job.worker.result else 'failed'
+            self.metrics.merge(job.worker.metrics)
+            self.metrics.count(f"jobs_{status}")
+            with self._lock:
+                job.status = {'ok': 'done'}.get(status, status)
+                job.finished = time.time()
+            self._maintain_memory()
+
+    def _maintain_memory(self):
+        """淘汰過期的翻譯記憶並提交寫入"""
+        memory = self.engine.memory
+        if memory is None:
+            return
+        try:
+            removed = memory.evict()
+        except sqlite3.Error as e:
+            print(f"[WARNING] Translation memory eviction failed: {e}")
+            return
+        if removed:
+            self.engine.log(f"Translation memory: evicted {removed} entries")
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """取消工作：排隊中的直接取消，執行中的在已送出的請求完成後停止；返回工作或 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return job
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished = time.time()
+                job.future.cancel()
+            else:
+                job.worker.cancel()
+            return job
+
+    def remove(self, job_id):
+        """刪除已結束的工作與其檔案；返回 False 表示工作仍在進行"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return True
+            if job.active:
+                return False
+            del self._jobs[job_id]
+        shutil.rmtree(job.dir, ignore_errors=True)
+        return True
+
+    def shutdown(self):
+        """取消所有工作並關閉引擎"""
+        for job in self.list():
+            self.cancel(job.id)
+        self._executor.shutdown(wait=True)
+        self.engine.close()
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 介面：
+    
+    POST   /jobs?lang=&pages=&filename=  以 PDF 內容為請求本體提交工作（佇列已滿時回應 503）
+    GET    /jobs                         列出所有工作
+    GET    /jobs/<id>                    工作狀態（含進度與結果）
+    GET    /jobs/<id>/progress           只取進度
+    GET    /jobs/<id>/output             下載譯文 PDF
+    POST   /jobs/<id>/cancel             取消工作
+    DELETE /jobs/<id>                    刪除已結束的工作與檔案
+    GET    /health                       服務狀態
+    GET    /metrics                      所有已結束工作的指標加總（Prometheus 文字格式）
+    """
+    
+    server_version = 'PDFTranslatorService/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {'error': message}, headers)
+
+    def _route(self):
+        """返回 (路徑片段, 查詢參數)"""
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        return parts, {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def _find_job(self, job_id):
+        job = self.service.get(job_id)
+        if job is None:
+            self._send_error(404, f'no such job: {job_id}')
+        return job
+
+    def do_GET(self):
+        parts, _ = self._route()
+        if parts == ['health']:
+            self._send_json(200, {'status': 'ok', 'jobs': self.service.counts()})
+        elif parts == ['metrics']:
+            self.service.metrics.finish()
+            lines = ['# TYPE pdf_translator_jobs gauge']
+            lines.extend(f'pdf_translator_jobs{{status="{status}"}} {count}'
+                         for status, count in sorted(self.service.counts().items()))
+            text = self.service.metrics.prometheus_text(engine=self.service.engine.engine) + '\n'.join(lines) + '\n'
+            body = text.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ['jobs']:
+            self._send_json(200, {'jobs': [job.describe() for job in self.service.list()]})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self._find_job(parts[1])
+            if job:
+                self._send_json(200, job.describe())
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'progress':
+            job = self._find_job(parts[1])
+            if job:
+                self._send_json(200, {'id': job.id, 'status': job.status, **job.worker.progress})
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'output':
+            job = self._find_job(parts[1])
+            if job is None:
+                return
+            if job.status != 'done':
+                self._send_error(409, f'job is {job.status}')
+                return
+            with open(job.worker.output_pdf, 'rb') as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Content-Disposition', content_disposition(job.filename))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_error(404, 'not found')
+
+    def do_POST(self):
+        parts, query = self._route()
+        if parts == ['jobs']:
+            self._submit(query)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            job = self.service.cancel(parts[1])
+            if job is None:
+                self._send_error(404, f'no such job: {parts[1]}')
+            else:
+                self._send_json(202, job.describe())
+        else:
+            self._send_error(404, 'not found')
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == 'jobs':
+            if self.service.remove(parts[1]):
+                self._send_json(200, {'id': parts[1], 'deleted': True})
+            else:
+                self._send_error(409, 'job is still active; cancel it first')
+        else:
+            self._send_error(404, 'not found')
+
+    def _submit(self, query):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_error(411, 'request body must be the PDF file with a Content-Length')
+            return
+        if length > self.server.max_upload:
+            self._send_error(413, f'upload exceeds {self.server.max_upload // (1024*1024)} MB')
+            return
+        # 佇列已滿時不讀取本體，直接要求稍後重試
+        if self.service.counts().get('queued', 0) >= self.service.queue_size:
+            self.close_connection = True
+            self._send_error(503, 'queue is full, retry later', {'Retry-After': '5'})
+            return
+        data = self.rfile.read(length)
+        if not data.startswith(b'%PDF'):
+            self._send_error(400, 'request body is not a PDF file')
+            return
+        
+        job = self.service.submit(data, query.get('filename', 'document.pdf'), query.get('lang'), query.get('pages'))
+        if job is None:
+            self._send_error(503, 'queue is full, retry later', {'Retry-After': '5'})
+            return
+        self._send_json(202, job.describe(), {'Location': f'/jobs/{job.id}'})
+
+
+def main():
+    configure_stdout()
+    parser = argparse.ArgumentParser(
+        description='PDF Translation Service - keep the translator warm and accept jobs over a local HTTP API',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Start the service on 127.0.0.1:8765 with the Google engine
+  python pdf_translator_server.py
+
+  # Use Ollama, 4 documents at a time, at most 32 waiting jobs
+  python pdf_translator_server.py --engine ollama --jobs 4 --queue-size 32
+
+  # Submit, poll and download
+  curl --data-binary @input.pdf -H "Content-Type: application/pdf" "http://127.0.0.1:8765/jobs?lang=ja&filename=input.pdf"
+  curl http://127.0.0.1:8765/jobs/<id>/progress
+  curl -o output.pdf http://127.0.0.1:8765/jobs/<id>/output
+  curl -X POST http://127.0.0.1:8765/jobs/<id>/cancel
+  curl http://127.0.0.1:8765/metrics
+        """
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on (default: 8765)')
+    parser.add_argument(
+        '--jobs', '-j',
+        type=int,
+        default=2,
+        help='Documents translated at the same time (default: 2)'
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=16,
+        help='Waiting jobs accepted before new submissions get 503 (default: 16)'
+    )
+    parser.add_argument(
+        '--spool-dir',
+        help='Folder for uploaded and translated files (default: a new temporary folder)'
+    )
+    parser.add_argument(
+        '--max-upload-mb',
+        type=int,
+        default=200,
+        help='Largest accepted upload in MB (default: 200)'
+    )
+    parser.add_argument(
+        '--lang', '-l',
+        default='zh-TW',
+        help='Default target language; jobs may override it with ?lang= (default: zh-TW)'
+    )
+    parser.add_argument(
+        '--engine', '-e',
+        choices=sorted(ENGINES),
+        default='google',
+        help='Translation engine: google (default), ollama (requires Ollama running locally) '
+             'or mock (offline fake translations for testing)'
+    )
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=4,
+        help='Translation requests in flight per document (default: 4)'
+    )
+    parser.add_argument(
+        '--batch-tokens',
+        type=int,
+        default=1000,
+        help='Token budget per Ollama batch prompt; 0 sends one span per request (default: 1000)'
+    )
+    parser.add_argument(
+        '--batch-chars',
+        type=int,
+        default=5000,
+        help='Character budget per combined Google request; 0 sends one span per request (default: 5000)'
+    )
+    parser.add_argument(
+        '--async',
+        dest='async_requests',
+        action='store_true',
+        help='Send all jobs\' requests from one asyncio event loop instead of worker threads (ollama only)'
+    )
+    parser.add_argument('--rate', type=float, help='Initial requests per second shared by all jobs')
+    parser.add_argument('--max-rate', type=float, help='Upper bound for the adaptive request rate')
+    parser.add_argument('--segment', choices=SEGMENT_MODES, default='span', help='Translation unit (default: span)')
+    parser.add_argument('--redact', choices=REDACT_MODES, default='text', help='How original text is removed (default: text)')
+    parser.add_argument(
+        '--cache-dir',
+        help=f'Translation memory directory (default: {default_cache_dir()})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Disable the persistent translation memory'
+    )
+    parser.add_argument(
+        '--verbose', '-v',
+        action='store_true',
+        help='Log every HTTP request and per-job details'
+    )
+    
+    args = parser.parse_args()
+    
+    engine = PDFTranslatorCLI(
+        None,
+        None,
+        target_lang=args.lang,
+        verbose=args.verbose,
+        engine=args.engine,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        use_cache=not args.no_cache,
+        batch_tokens=args.batch_tokens,
+        batch_chars=args.batch_chars,
+        rate=args.rate,
+        max_rate=args.max_rate,
+        segment=args.segment,
+        redact=args.redact,
+        async_requests=args.async_requests
+    )
+    # 啟動時就完成翻譯器、字型與翻譯記憶的準備，之後每個工作只需付出翻譯本身的時間
+    print("Preparing translation engine...")
+    if not engine.prepare():
+        sys.exit(1)
+    
+    spool_dir = args.spool_dir or tempfile.mkdtemp(prefix='pdf-translator-service-')
+    service = TranslationService(engine, spool_dir, args.jobs, args.queue_size)
+    server = ThreadingHTTPServer((args.host, args.port), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = args.verbose
+    server.max_upload = args.max_upload_mb * 1024 * 1024
+    
+    def on_terminate(signum, frame):
+        # 以 SIGTERM 停止服務時與 Ctrl+C 走相同的收尾流程
+        raise KeyboardInterrupt
+    
+    signal.signal(signal.SIGTERM, on_terminate)
+    print(f"Listening on http://{args.host}:{server.server_port} "
+          f"({args.jobs} job(s) at a time, queue {args.queue_size}, spool {spool_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        service.shutdown()
+        if not args.spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()